@@ -0,0 +1,166 @@
+# ANALYTICS.PY
+#
+# What a planner asks of a finished schedule, computed from the assignments
+# instead of re-reading the table:
+#   positions   demanded and covered hours, and the runs left uncovered
+#   employees   assigned hours against the hours they asked for, and how
+#               many separate blocks their assignments fall into
+#
+# One pass over the assignments and the shift slots adds +1/-1 at the ends
+# of each span to a per-day difference array, one per owner and day. A
+# prefix sum over each day then gives open positions and busy employees
+# per cell, without expanding intervals into slots
+from bitsets import AvailabilityBits
+from scheduler import Interval, ScheduleInterpreter, Slot, SlotTable
+
+from itertools import accumulate
+
+
+class PositionCoverage():
+    """
+    Purely a data object, one shift template over the cycle
+    uncovered holds (day_in_cycle, start, end) runs nobody was assigned to """
+
+    def __init__(self, ID, name):
+        self.ID = ID
+        self.name = name
+        self.demanded_hours = 0.0
+        self.covered_hours = 0.0
+        self.uncovered = list()
+
+    def as_dict(self):
+        return {'id': self.ID, 'name': self.name, 'demanded_hours': self.demanded_hours,
+                'covered_hours': self.covered_hours,
+                'uncovered': [list(run) for run in self.uncovered]}
+
+
+class EmployeeHours():
+    """
+    Purely a data object, one employee over the cycle
+    requested_hours is None when their availability did not say """
+
+    def __init__(self, ID, name, requested_hours=None):
+        self.ID = ID
+        self.name = name
+        self.requested_hours = requested_hours
+        self.assigned_hours = 0.0
+        self.blocks = 0 # Contiguous runs of assigned time, split at midnight
+
+    def as_dict(self):
+        return {'id': self.ID, 'name': self.name, 'requested_hours': self.requested_hours,
+                'assigned_hours': self.assigned_hours, 'blocks': self.blocks}
+
+
+class ScheduleAnalytics():
+    """ Coverage of every position and hours of every employee in one schedule """
+
+    def __init__(self, interval=ScheduleInterpreter.SHIFT_LENGTH):
+        self.interval = interval
+        self.positions = dict() # shift owner ID -> PositionCoverage
+        self.employees = dict() # worker owner ID -> EmployeeHours
+
+    # Fill from assignments as assign_* return them, slot or interval pairs,
+    # and the shifts they were matched against: a SlotTable, Slots or Intervals
+    # requested_hours maps worker IDs to desired hours, e.g. SlotTable.hours,
+    # so employees assigned nothing are listed too
+    def add(self, assignments, shifts, requested_hours=None, names=None):
+        interval = self.interval
+        cells_per_day = Slot.MINUTES_PER_DAY // interval
+        open_cells = dict() # (shift ID, day) -> demand minus coverage, differenced
+        busy_cells = dict() # (worker ID, day) -> assignments, differenced
+        names = names or dict()
+
+        def difference(cells, ID, day_in_cycle, start, end, amount):
+            row = cells.get((ID, day_in_cycle))
+            if row is None:
+                row = cells[(ID, day_in_cycle)] = [0] * (cells_per_day + 1)
+
+            row[start // interval] += amount
+            row[-(-end // interval)] -= amount
+
+        for ID, hours in (requested_hours or dict()).items():
+            self.employee(ID, names.get(ID), hours)
+
+        for day_in_cycle, ID, name, start, end in iter_spans(shifts, interval):
+            self.position(ID, name).demanded_hours += (end - start) / 60
+            difference(open_cells, ID, day_in_cycle, start, end, 1)
+
+        for W, S in assignments:
+            day_in_cycle, ID, name, start, end = span_of(S, interval)
+            self.position(ID, name).covered_hours += (end - start) / 60
+            difference(open_cells, ID, day_in_cycle, start, end, -1)
+
+            day_in_cycle, ID, name, start, end = span_of(W, interval)
+            self.employee(ID, name).assigned_hours += (end - start) / 60
+            difference(busy_cells, ID, day_in_cycle, start, end, 1)
+
+        # Uncovered cells become one bitset per position, its runs are the gaps
+        bits = AvailabilityBits(interval)
+        for (ID, day_in_cycle), row in open_cells.items():
+            gaps = sum(1 << cell for cell, still_open in enumerate(accumulate(row))
+                           if still_open > 0)
+            bits.bits[ID] = bits[ID] | gaps << day_in_cycle * cells_per_day
+
+        for ID, mask in bits.bits.items():
+            self.positions[ID].uncovered += bits.runs(mask)
+
+        for (ID, day_in_cycle), row in busy_cells.items():
+            busy = False
+            for count in accumulate(row):
+                if count and not busy:
+                    self.employees[ID].blocks += 1
+                busy = count > 0
+
+        return self
+
+    def position(self, ID, name=None):
+        P = self.positions.get(ID)
+        if P is None:
+            P = self.positions[ID] = PositionCoverage(ID, name)
+
+        return P
+
+    def employee(self, ID, name=None, requested_hours=None):
+        E = self.employees.get(ID)
+        if E is None:
+            E = self.employees[ID] = EmployeeHours(ID, name, requested_hours)
+
+        return E
+
+    @property
+    def uncovered_hours(self):
+        return sum(end - start for P in self.positions.values()
+                       for day_in_cycle, start, end in P.uncovered) / 60
+
+    @property
+    def blocks(self):
+        return sum(E.blocks for E in self.employees.values())
+
+    def as_dict(self):
+        return {'positions': [P.as_dict() for P in self.positions.values()],
+                'employees': [E.as_dict() for E in self.employees.values()],
+                'uncovered_hours': self.uncovered_hours, 'blocks': self.blocks}
+
+
+# RETURN (day_in_cycle, ID, name, start, end) of a Slot or an Interval
+def span_of(item, interval):
+    if isinstance(item, Interval):
+        return item.day_in_cycle, item.ID, item.name, item.start, item.end
+
+    return item.day_in_cycle, item.ID, item.name, item.time_of_day, item.time_of_day + interval
+
+
+# Spans of a SlotTable's rows, or of any iterable of Slots and Intervals
+def iter_spans(shifts, interval):
+    if isinstance(shifts, SlotTable):
+        names = shifts.names
+        for day_in_cycle, ID, TOD in zip(shifts.day_in_cycle, shifts.owner, shifts.time_of_day):
+            yield day_in_cycle, ID, names.get(ID), TOD, TOD + interval
+    else:
+        for S in shifts:
+            yield span_of(S, interval)
+
+
+def analyze_schedule(assignments, shifts, requested_hours=None, names=None,
+                     interval=ScheduleInterpreter.SHIFT_LENGTH):
+    return ScheduleAnalytics(interval).add(assignments, shifts, requested_hours, names)
@@ -2,6 +2,20 @@ from scheduler import *
 from matcher import *
 from share_data import *
 from logger import *
+from bipartite import *
+from ingest import *
+from batch import *
+from session import *
+from cache import *
+from flow import *
+from metrics import *
+from service import HTTPError, ScheduleService
+from graphfile import *
+from solvers import *
+from bitsets import *
+from analytics import *
+
+import benchmark
 
 # Test file for validating conversions between I/O
 from pprint import pprint
@@ -44,6 +58,30 @@ class TestMachine():
         try:
             self.test_exclusive_slots()
             self.test_overlapping_slots()
+            self.test_in_process_matching()
+            self.test_interval_matching()
+            self.test_packed_slot_keys()
+            self.test_slot_table()
+            self.test_memoized_time_ranges()
+            self.test_sparse_table()
+            self.test_stream_table_as_csv()
+            self.test_disabled_logging_is_lazy()
+            self.test_streaming_ingestion()
+            self.test_batch_of_sites()
+            self.test_component_decomposition()
+            self.test_incremental_session()
+            self.test_schedule_cache()
+            self.test_hours_aware_flow()
+            self.test_benchmark_suite()
+            self.test_run_report()
+            self.test_schedule_service()
+            self.test_binary_graph_file()
+            self.test_solver_backends()
+            self.test_approximate_matching()
+            self.test_anytime_matching()
+            self.test_sort_merge_join()
+            self.test_availability_bitsets()
+            self.test_schedule_analytics()
             print("SUCCESS for new test(s)")
 
         except Exception:
@@ -96,6 +134,14 @@ class TestMachine():
         return table
 
 
+    # Helper method, not an actual test
+    def __write_json__(self, path, data):
+        import json
+
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file)
+
+
     ### General testing ###
 
     def test_create_slots_from_avail(self):
@@ -151,6 +197,736 @@ class TestMachine():
         table = self.__generate_schedule__(workers)
         log_debug(as_CSV(table))
 
+    def test_in_process_matching(self):
+        from itertools import combinations
+        import random
+
+        def brute_force_best(edges):
+            # Most pairs first, then most weight, over every valid subset
+            best = (0, 0)
+            for size in range(len(edges), 0, -1):
+                for subset in combinations(edges, size):
+                    if len(set(E[0] for E in subset)) == size \
+                        and len(set(E[1] for E in subset)) == size:
+                        best = max(best, (size, sum(E[2] for E in subset)))
+                if best[0]:
+                    return best
+            return best
+
+        generator = random.Random(15)
+        for trial in range(50):
+            weight_of = {
+                (generator.randrange(5), 10 + generator.randrange(5)): generator.randrange(4)
+                    for E in range(generator.randrange(1, 10))
+            }
+            edges = [(u, v, w) for (u, v), w in weight_of.items()]
+
+            weighted = max_weight_matching(edges)
+            unweighted = hopcroft_karp(edges)
+            result = (len(weighted), sum(weight_of[E] for E in weighted))
+
+            assert(len(set(u for u, v in weighted)) == len(weighted))
+            assert(len(set(v for u, v in weighted)) == len(weighted))
+            assert(result == brute_force_best(edges))
+            assert(len(unweighted) == result[0])
+
+    def test_component_decomposition(self):
+        # Two separate stars and a lone edge
+        edges = [(0, 10, 1), (1, 10, 2), (2, 11, 0), (2, 12, 5), (3, 12, 1), (4, 13, 0)]
+        adjacency = adjacency_of(edges)
+        components = connected_components(adjacency)
+
+        assert(sorted(sorted(C.keys()) for C in components) == [[0, 1], [2, 3], [4]])
+
+        report = []
+        decomposed = match_by_components(edges, report=report)
+        weight_of = {(u, v): w for u, v, w in edges}
+
+        assert(len(report) == 3)
+        assert(sum(R.edges for R in report) == len(edges))
+        assert(sorted(R.vertices for R in report) == [2, 3, 4])
+        assert(len(decomposed) == len(max_weight_matching(edges)) == 4)
+        assert(sum(weight_of[E] for E in decomposed) == 2 + 0 + 1 + 0)
+
+        workers = (avail_T, avail_WTF, ben_avail)
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_table = self.scheduler.make_slot_table(
+            ScheduleInterpreter.TYPE_SHIFT, open_position_for_makerspace)
+        report = []
+        assign_shifts(w_table, s_table, report)
+        # One component per (day, time of day) with any overlap
+        assert(len(report) == len(set(w_table.key) & set(s_table.key)))
+
+    def test_incremental_session(self):
+        import copy
+
+        positions = [open_position_for_makerspace, open_position_for_makerspace]
+        session = SchedulingSession(positions)
+        roster = {'T': avail_T, 'WTF': avail_WTF, 'Ben': ben_avail, 'Short': short_avail}
+
+        def full_solve_size(workers):
+            w_table = self.scheduler.make_slot_table(
+                ScheduleInterpreter.TYPE_WORKER, *copy.deepcopy(list(workers)))
+            s_table = self.scheduler.make_slot_table(
+                ScheduleInterpreter.TYPE_SHIFT, *copy.deepcopy(positions))
+            return len(assign_shifts(w_table, s_table))
+
+        for employee_id, availability in roster.items():
+            session.add_availability(employee_id, availability)
+        assert(len(session.assignments()) == full_solve_size(roster.values()))
+
+        before = {S: W.ID for W, S in session.assignments()}
+        moved = session.remove_availability('Ben')
+        after = {S: W.ID for W, S in session.assignments()}
+        del roster['Ben']
+
+        # Only shifts Ben held may change hands
+        changed = [S for S in before if after.get(S) != before[S]]
+        assert(all(before[S] == 'Ben' for S in changed))
+        assert(moved <= len(changed))
+        assert(len(after) == full_solve_size(roster.values()))
+
+        session.update_availability('Short', {'name': 'Shortie', 'U': '10:00-17:00'})
+        roster['Short'] = {'name': 'Shortie', 'U': '10:00-17:00'}
+        assert(len(session.assignments()) == full_solve_size(roster.values()))
+        assert(len(session.make_schedule()) > 1)
+
+    def test_schedule_cache(self):
+        from tempfile import TemporaryDirectory
+        import json
+        import os
+
+        with TemporaryDirectory() as directory:
+            availability_file = os.path.join(directory, "roster.json")
+            output = os.path.join(directory, "out.csv")
+            self.__write_json__(availability_file, [avail_T, avail_WTF])
+            cache = ScheduleCache(os.path.join(directory, "cache"))
+
+            solved = make_matching(availability_file, output=output, cache=cache)
+            cached = make_matching(availability_file, output=output, cache=cache)
+            assert(cached == solved)
+            assert(cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1)
+
+            # Same people with differently spelled keys are the same request
+            self.__write_json__(availability_file,
+                                [{'NAME': 'B_T', 'HOURS': '2', '1': all_day}, avail_WTF])
+            make_matching(availability_file, output=output, cache=cache)
+            assert(cache.hits == 2)
+
+            # Different templates are a different request
+            mornings = [{'name': 'Desk', 'M': '10:00-12:00'}]
+            make_matching(availability_file, output=output, cache=cache, shift_templates=mornings)
+            assert(cache.misses == 2 and cache.stats()['entries'] == 2)
+
+            # Another backend is another request, an unregistered one is never cached
+            make_matching(availability_file, output=output, cache=cache, shift_templates=mornings,
+                          backend='greedy')
+            assert(cache.misses == 3 and cache.stats()['entries'] == 3)
+            make_matching(availability_file, output=output, cache=cache, shift_templates=mornings,
+                          backend=AnytimeBackend(time_limit=1.0))
+            assert(cache.misses == 3 and cache.stats()['entries'] == 3)
+            assert(registered_name(get_backend('greedy')) == 'greedy')
+
+            # Past the size bound, the least recently used entry goes first
+            key = ScheduleCache.key_for("a third request")
+            cache.max_bytes = cache.stats()['bytes']
+            cache.put(key, [["Time of Day"]])
+            assert(cache.stats()['entries'] == 3)
+            assert(cache.get(key) == [["Time of Day"]])
+
+    def test_hours_aware_flow(self):
+        # Textbook network: cheapest way to send 2 units is 1 via each route
+        network = MinCostFlow()
+        s, a, b, t = [network.add_node() for n in range(4)]
+        network.add_edge(s, a, 2, -1)
+        network.add_edge(s, b, 1, -2)
+        network.add_edge(a, t, 1, 0)
+        network.add_edge(b, t, 2, 0)
+        network.add_edge(a, b, 1, 0)
+        assert(network.solve(s, t) == (3, -4))
+
+        # Both free all Monday for one position, 28 slots to share
+        monday = {'M': '10:00-17:00'}
+        workers = [dict(monday, name='Two', hours='2'), dict(monday, name='Five', hours=5)]
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT, monday)
+        assignments = assign_by_hours(w_table, s_table)
+        slots_of = {'Two': 0, 'Five': 0}
+
+        for W, S in assignments:
+            slots_of[W.name] += 1
+
+        assert(w_table.hours == {0: 2.0, 1: 5.0})
+        assert(len(assignments) == 28)
+        assert(slots_of == {'Two': 2 * 4, 'Five': 5 * 4})
+
+    def test_benchmark_suite(self):
+        # Same seed, same roster; fragmented days keep to their ranges
+        assert(benchmark.make_roster(20, seed=3) == benchmark.make_roster(20, seed=3))
+        for avail in benchmark.make_roster(20, fragmentation=3, density=1):
+            assert(all(1 <= len(avail[D].split(',')) <= 3 for D in ScheduleInterpreter.DOW))
+
+        result = benchmark.run_scenario(employees=10, positions=1, memory=False, repeat=3)
+        assert(list(result['stages']) == benchmark.STAGES)
+        assert(0 < result['counts']['matched'] <= result['counts']['edges'])
+        assert(all(S['runs'] == 3 and S['min_ms'] <= S['ms'] for S in result['stages'].values()))
+
+        # Only slowdowns past the tolerance count, tiny stages are noise
+        slower = {'parameters': result['parameters'], 'stages': {
+            'decide_matching': {'ms': 130.0}, 'write_CSV': {'ms': 0.5},
+            'make_slot_table': {'ms': 10.0}}}
+        baseline = [{'parameters': result['parameters'], 'stages': {
+            'decide_matching': {'ms': 100.0}, 'write_CSV': {'ms': 0.1},
+            'make_slot_table': {'ms': 10.0}}}]
+        regressions = benchmark.find_regressions(baseline, [slower], tolerance=0.2)
+        assert([stage for name, stage, before, after in regressions] == ['decide_matching'])
+
+        keys = benchmark.bench_slot_keys(num_employees=10, num_positions=1, repeat=1)
+        assert(keys['slots'] > 0 and all(ms >= 0 for name, ms in keys.items() if 'ms' in name))
+
+    def test_run_report(self):
+        from tempfile import TemporaryDirectory
+        import json
+        import os
+
+        with TemporaryDirectory() as directory:
+            availability_file = os.path.join(directory, "roster.json")
+            metrics_file = os.path.join(directory, "run.prom")
+            self.__write_json__(availability_file, [avail_T, avail_WTF])
+
+            report = RunReport()
+            table = make_matching(availability_file, output=os.path.join(directory, "out.csv"),
+                                  report=report, metrics_file=metrics_file)
+            with open(metrics_file) as exported_file:
+                exported = exported_file.read()
+
+        assert(list(report.stages) == ['parse', 'make_slots', 'select_matching_pairs',
+                                       'solve', 'make_schedule', 'write_CSV'])
+        assert(report.counters['matched'] == 4 * 28)
+        assert(report.counters['components'] == len(report.components) == len(report))
+        assert(report.counters['vertices'] <= report.counters['worker_slots'] + report.counters['shift_slots'])
+        assert(exported == report.as_prometheus())
+        assert('shift_scheduler_stage_seconds{stage="solve"}' in exported)
+        assert(f"shift_scheduler_edges {report.counters['edges']}" in exported)
+
+        # Min-cost flow counts vertices the way components do, slots with an edge
+        with TemporaryDirectory() as directory:
+            availability_file = os.path.join(directory, "roster.json")
+            self.__write_json__(availability_file, [avail_T, avail_WTF])
+            by_hours = RunReport()
+            make_matching(availability_file, output=os.path.join(directory, "out.csv"),
+                          honor_hours=True, report=by_hours)
+        assert(by_hours.counters['vertices'] == report.counters['vertices'])
+
+        # Only the min-cost flow honors hours, other choices are refused, not dropped
+        for conflict in ({'by_interval': True}, {'backend': 'greedy'}, {'streaming': True}):
+            try:
+                make_matching("never read", honor_hours=True, **conflict)
+                raise AssertionError(f"honor_hours accepted {conflict}")
+            except ValueError as e:
+                assert(str(e).endswith(next(iter(conflict))))
+
+        # So does the stream, counting its edges once, not per edge
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT,
+                                                 *[dict(T) for T in DEFAULT_SHIFT_TEMPLATES])
+        streamed = RunReport()
+        stream_assign_shifts(self.scheduler, [dict(avail_T), dict(avail_WTF)], s_table, streamed)
+        assert(streamed.counters['edges'] == report.counters['edges'])
+        assert(streamed.counters['vertices'] == report.counters['vertices'])
+
+        # Plain lists still only collect components, nobody else is timed
+        assert(instrument([]) is NO_REPORT and instrument(None) is NO_REPORT)
+        with NO_REPORT.stage('anything'):
+            NO_REPORT.count('anything')
+
+    def test_schedule_service(self):
+        import asyncio
+        import json
+
+        async def exchange(connection, method, path, body=None):
+            reader, writer = connection
+            payload = b'' if body is None else json.dumps(body).encode('utf-8')
+            writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\n\r\n"
+                         .encode('latin-1') + payload)
+            status = int((await reader.readline()).split()[1])
+            length = 0
+
+            while (line := await reader.readline()) != b'\r\n':
+                name, value = line.decode('latin-1').split(':', 1)
+                if name.lower() == 'content-length':
+                    length = int(value)
+
+            return status, json.loads(await reader.readexactly(length))
+
+        async def conversation():
+            service = ScheduleService(workers=2, max_concurrent=2)
+            server = await service.start(port=0)
+            connection = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            answers = list()
+
+            # Same connection throughout, the shift table is built once
+            for request in [{'availability': [avail_T, avail_WTF]}] * 2:
+                answers.append(await exchange(connection, 'POST', '/schedule', request))
+            answers.append(await exchange(connection, 'POST', '/sessions', {}))
+            answers.append(await exchange(connection, 'PUT', '/sessions/1/employees/B_T', avail_T))
+            answers.append(await exchange(connection, 'GET', '/sessions/1/schedule'))
+            answers.append(await exchange(connection, 'DELETE', '/sessions/1/employees/B_T'))
+            answers.append(await exchange(connection, 'GET', '/sessions/2/schedule'))
+            answers.append(await exchange(connection, 'POST', '/schedule', None))
+            answers.append(await exchange(connection, 'GET', '/health'))
+            answers.append(await exchange(connection, 'POST', '/schedule',
+                                          {'availability': [avail_T, avail_WTF], 'time_limit': 5}))
+            answers.append(await exchange(connection, 'PUT', '/sessions/1/employees/B_T', {}))
+            answers.append(await exchange(connection, 'POST', '/schedule',
+                                          {'availability': [avail_T], 'honor_hours': True,
+                                           'time_limit': 0}))
+
+            # Bad input is the client's to fix: 400, never 500
+            answers.append([(await exchange(connection, method, path, body))[0]
+                            for method, path, body in [
+                ('POST', '/schedule', {'availability': [avail_T], 'backend': 'greedy',
+                                       'time_limit': 1}),
+                ('POST', '/schedule', {'availability': [avail_T], 'backend': 'nonexistent'}),
+                ('POST', '/schedule', {'availability': [avail_T], 'time_limit': 'soon'}),
+                ('POST', '/schedule', {'availability': [avail_T, 7]}),
+                ('POST', '/schedule', {'availability': [{'name': 'X', 'M': 'nonsense-xx'}]}),
+                ('POST', '/schedule', {'availability': [avail_T], 'by_interval': True,
+                                       'shifts': [{'name': 'X', 'M': 'nonsense-xx'}]}),
+                ('POST', '/sessions', {'shifts': ['Desk']}),
+                ('PUT', '/sessions/1/employees/A_M', {'name': 'A_M', 'M': 'nonsense-xx'}),
+                ('GET', '/sessions/1/schedule', None)]])
+            answers.append(await exchange(connection, 'POST', '/schedule',
+                                          {'availability': [avail_T], 'backend': 'anytime',
+                                           'time_limit': 5}))
+
+            # Not HTTP at all still gets an answer before the connection closes
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b"GARBAGE\r\n")
+            answers.append(int((await reader.readline()).split()[1]))
+            writer.close()
+
+            connection[1].close()
+            server.close()
+            await server.wait_closed()
+            service.close()
+            return answers
+
+        (solved, again, opened, added, schedule, removed, unknown, empty, health, limited,
+            blank, conflicting, rejected, timed, garbage) = asyncio.run(conversation())
+
+        assert(solved[0] == 200 and solved[1]['table'] == again[1]['table'])
+        assert(solved[1]['report']['counters']['matched'] == 4 * 28)
+        assert(opened == (200, {'session': '1'}))
+        assert(added == (200, {'moved': 28}))
+        assert(schedule[0] == 200 and len(schedule[1]['table']) == 29)
+        assert(removed == (200, {'moved': 0}))
+        assert(unknown[0] == 404)
+        assert(empty[0] == 200 and empty[1]['report']['counters']['matched'] == 0)
+        assert(health[1]['shift_tables'] == 1 and health[1]['sessions'] == 1)
+        assert(limited[1]['report']['counters']['matched'] == 4 * 28)
+        assert(blank[0] == 400 and garbage == 400)
+        assert(conflicting == (400, {'error': "honor_hours can not be combined with backend"}))
+        assert(rejected[:-1] == [400] * (len(rejected) - 1) and rejected[-1] == 200)
+        assert(timed[0] == 200 and timed[1]['report']['counters']['matched'] == 28)
+
+        # Past its timeout a request answers 504, the worker is not waited for,
+        # but it keeps its lock until done, so the next edit runs after it
+        async def too_slow():
+            from time import sleep
+            service = ScheduleService(workers=2, timeout=0.05)
+            lock = asyncio.Lock()
+            finished = list()
+
+            try:
+                try:
+                    await service.offload(lambda: sleep(0.2) or finished.append('slow'), lock=lock)
+                except HTTPError as e:
+                    status = e.status
+
+                held = lock.locked()
+                service.timeout = 2.0
+                await service.offload(finished.append, 'next', lock=lock)
+                return status, held, finished, lock.locked()
+            finally:
+                service.close()
+
+        assert(asyncio.run(too_slow()) == (504, True, ['slow', 'next'], False))
+
+    def test_binary_graph_file(self):
+        from io import BytesIO
+        from tempfile import TemporaryDirectory
+        import os
+
+        edges = [(0, 3, 7), (1, 3, 0), (2, 4, -5), (2**31 - 1, 0, 2**40)]
+
+        with TemporaryDirectory() as directory:
+            graph_file = os.path.join(directory, "graph.bin")
+            solution_file = os.path.join(directory, "solution.bin")
+
+            written = save_graph_for_solver(edges, 5, graph_file)
+            assert(written == os.path.getsize(graph_file) == HEADER.size + len(edges) * 16)
+
+            # Mapped, not parsed: the columns are views into the file
+            with read_graph(graph_file) as graph:
+                assert(isinstance(graph.u, memoryview) and graph.num_vertices == 5)
+                assert(list(graph.edges()) == edges)
+                assert(decide_matching(graph.edges()) == decide_matching(edges))
+
+            write_graph(solution_file, 5, array('i', [0, 2]), array('i', [3, 4]))
+            assert(read_graph_solution(solution_file) == [(0, 3), (2, 4)])
+
+        # Pipes hand over bytes, same layout
+        assert(list(unpack_graph(pack_graph(2, [0], [1])).edges()) == [(0, 1)])
+
+        for broken in [b'', b'SSGR', pack_graph(2, [0], [1])[:-1], b'XXXX' + bytes(20)]:
+            try:
+                unpack_graph(broken)
+                assert(False)
+            except ValueError:
+                pass
+
+        # Streams carry no count, a generator is written a chunk at a time
+        stream = BytesIO()
+        assert(write_stream(stream, iter(edges), chunk=3) == len(edges))
+        assert(stream.getvalue()[:4] == STREAM_MAGIC)
+        assert(list(read_stream(BytesIO(stream.getvalue()), chunk=1)) == edges)
+
+        pairs = BytesIO()
+        write_stream(pairs, [(0, 3), (2, 4)], weighted=False)
+        assert(list(read_stream(BytesIO(pairs.getvalue()))) == [(0, 3), (2, 4)])
+
+        for broken in [b'', b'SSGS', stream.getvalue()[:-1], b'XXXX' + bytes(20)]:
+            try:
+                list(read_stream(BytesIO(broken)))
+                assert(False)
+            except ValueError:
+                pass
+
+    def test_solver_backends(self):
+        import sys
+
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, avail_T, avail_WTF)
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT, avail_T)
+        in_process = assign_shifts(w_table, s_table)
+
+        # The pipe backend runs this repo's own solver as a child process
+        assert(assign_shifts(w_table, s_table, backend='pipe') == in_process)
+        assert(decide_matching(iter([(0, 1, 5)]), backend='pipe') == [(0, 1)])
+        assert(decide_matching([], backend=BACKENDS['pipe']) == [])
+
+        # Far more than a pipe buffer each way, written and read as it goes
+        many = ((E, 100000 + E, 1) for E in range(20000))
+        assert(len(get_backend('pipe').solve(many)) == 20000)
+
+        first_pairs = CallableBackend(lambda edges: [(u, v) for u, v, w in edges][:1],
+                                      'first', weighted=False)
+        assert(decide_matching([(0, 2, 0), (1, 3, 0)], backend=first_pairs) == [(0, 2)])
+
+        assert(select_backend(weighted=True).name == 'python')
+        assert(select_backend(time_limit=True).name == 'anytime')
+        assert(not first_pairs.supports(weighted=True))
+
+        failing = PipeBackend([sys.executable, '-c', 'import sys; sys.exit(3)'], 'failing')
+        sleeping = PipeBackend([sys.executable, '-c', 'import time; time.sleep(5)'], 'sleeping')
+        for backend, error, options in [('nonexistent', ValueError, {}),
+                                        (failing, SolverError, {}),
+                                        (sleeping, TimeoutError, {'time_limit': 0.2})]:
+            try:
+                get_backend(backend).solve([(0, 1, 0)], **options)
+                assert(False)
+            except error:
+                pass
+
+    def test_approximate_matching(self):
+        import random
+
+        # Greedy takes the heavy edge and strands worker 1, one short path fixes it
+        edges = [(0, 10, 5), (0, 11, 1), (1, 10, 1)]
+        greedy, improved = [], []
+        assert(approximate_matching(edges, phases=0, report=greedy) == [(0, 10)])
+        assert(sorted(approximate_matching(edges, phases=1, report=improved)) == [(0, 11), (1, 10)])
+        assert(greedy[0].upper_bound == 2 and greedy[0].ratio == 0.5)
+        assert(improved[0].upper_bound == 2 and improved[0].ratio == 1.0)
+
+        # The bound holds against the exact solver on random graphs
+        generator = random.Random(7)
+        for trial in range(20):
+            edges = {(generator.randrange(30), 100 + generator.randrange(30)): generator.randrange(3)
+                        for E in range(60)}
+            edges = [(u, v, w) for (u, v), w in edges.items()]
+            report = []
+            approximate = approximate_matching(edges, phases=1, report=report)
+            exact = hopcroft_karp(edges)
+            assert(len(approximate) <= len(exact) <= report[0].upper_bound)
+            assert(len(set(u for u, v in approximate)) == len(set(v for u, v in approximate)))
+
+        # Per call through the backend registry, slot graphs come out whole
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, avail_T, avail_WTF)
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT, avail_T)
+        report = RunReport()
+        assigned = assign_shifts(w_table, s_table, report, backend='greedy')
+        assert(len(assigned) == len(assign_shifts(w_table, s_table)))
+        assert(report.counters['upper_bound'] == report.counters['matched'])
+
+    def test_anytime_matching(self):
+        from threading import Event
+        from time import perf_counter
+        import random
+
+        generator = random.Random(11)
+        edges = {(generator.randrange(40), 100 + generator.randrange(40)): generator.randrange(5)
+                    for E in range(150)}
+        edges = [(u, v, w) for (u, v), w in edges.items()]
+        weight_of = {(u, v): w for u, v, w in edges}
+
+        def total_weight(matching):
+            return sum(weight_of[pair] for pair in matching)
+
+        # Given the time, as good as the exact solver
+        exact = decide_matching(edges)
+        steps, report = [], []
+        unlimited = anytime_matching(edges, progress=steps.append, report=report)
+        assert(len(unlimited) == len(exact) == report[0].upper_bound)
+        assert(total_weight(unlimited) == total_weight(exact))
+        assert(steps[0].matched <= steps[-1].matched == len(exact))
+
+        # Past the deadline or cancelled, greedy is returned with its bound
+        cancel = Event()
+        cancel.set()
+        for options in [{'deadline': perf_counter()}, {'cancel': cancel}]:
+            report = []
+            hurried = anytime_matching(edges, report=report, **options)
+            assert(len(hurried) <= len(exact) <= report[0].upper_bound)
+
+        # Through the matcher, by time limit
+        assert(len(decide_matching(edges, time_limit=10)) == len(exact))
+        try:
+            decide_matching(edges, backend='greedy', time_limit=1)
+            assert(False)
+        except ValueError:
+            pass
+
+    def test_sort_merge_join(self):
+        workers = [avail_M, avail_T, avail_WTF, {'name': 'Brief', 'M': '10:00-10:30'}]
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT, avail_M, avail_WTF)
+
+        # Same edges as the hash-join, already as solver-ready columns
+        u, v, weights = merge_matching_rows(w_table, s_table, shift_offset=1000)
+        w_rows, s_rows = select_matching_rows(w_table, s_table)
+        assert(all(isinstance(column, array) for column in (u, v, weights)))
+        assert(sorted(zip(u, v, weights)) ==
+               sorted((w, 1000 + s, w_table.weight[w]) for w, s in zip(w_rows, s_rows)))
+        assert(len(u) == 28 + 28 + 3 * 28 + 2) # avail_WTF's T is Tuesday
+
+        # Columns go to a graph file as they are
+        graph = unpack_graph(pack_graph(1000 + len(s_table), u, v, weights))
+        assert(list(graph.edges()) == list(zip(u, v, weights)))
+
+        empty = SlotTable()
+        assert(merge_matching_rows(empty, s_table) == (array('l'), array('l'), array('l')))
+
+        # Rows outside the other table's cells are left out before sorting
+        keys, rows = sort_rows_by_key(w_table, keys_to_bits(s_table.key))
+        assert(set(keys) == set(w_table.key) & set(s_table.key))
+        assert(all(w_table.key[row] == key for key, row in zip(keys, rows)))
+        assert(merge_matching_rows(w_table, s_table, 1000, interval=5) == (u, v, weights))
+
+    def test_availability_bitsets(self):
+        workers = [avail_M, avail_T, avail_WTF, {'name': 'Brief', 'M': '10:00-10:30'}]
+        w_bits = make_bitsets(self.scheduler, ScheduleInterpreter.TYPE_WORKER,
+                              *[dict(A) for A in workers])
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER,
+                                                 *[dict(A) for A in workers])
+        A_M, B_T, C_WTF, brief = w_bits.bits
+
+        # Same cells whether built from runs or from slot rows
+        assert(w_bits.bits == AvailabilityBits.from_table(w_table).bits)
+        assert(w_bits.names[brief] == 'Brief')
+        assert(w_bits.hours(A_M) == 7 and w_bits.hours(brief) == 0.5)
+
+        # Overlap and who is free are single bit operations
+        assert(w_bits.overlap(A_M, brief) == w_bits[brief])
+        assert(w_bits.overlap(A_M, C_WTF) == 0)
+        assert(w_bits.overlap(B_T, C_WTF) == w_bits[B_T])
+        monday = w_table.day_in_cycle[0]
+        assert(w_bits.free_at(monday, 10 * 60 + 15) == [A_M, brief])
+        assert(w_bits.free_at(monday, 10 * 60 + 30) == [A_M])
+        assert(w_bits.free_at(monday, 9 * 60) == [])
+        assert(w_bits.overlapping(w_bits[B_T]) == [B_T, C_WTF])
+
+        # Coverage turns back into runs of the day, one per day covered
+        runs = list(w_bits.runs(w_bits.coverage()))
+        assert(len(runs) == 4)
+        assert(all((start, end) == (10 * 60, 17 * 60) for day, start, end in runs))
+        assert(list(w_bits.runs(w_bits.mask(0, 23 * 60, 25 * 60))) ==
+               [(0, 23 * 60, 24 * 60), (1, 0, 60)])
+
+        # Prefiltered hash-join still finds every pair, from either side
+        w_slots = self.scheduler.make_slots(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_slots = self.scheduler.make_slots(ScheduleInterpreter.TYPE_SHIFT, avail_M)
+        pairs = select_matching_pairs(w_slots, s_slots)
+        assert(len(pairs) == 28 + 2)
+        assert(all(W.key == S.key for W, S in pairs))
+        assert(sorted(map(repr, select_matching_pairs(s_slots, w_slots))) ==
+               sorted(repr((S, W)) for W, S in pairs))
+
+        # Hourly slots filter on hourly cells, a default-sized cell still pairs them
+        hourly = ScheduleInterpreter(shift_len=60)
+        w_slots = hourly.make_slots(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_slots = hourly.make_slots(ScheduleInterpreter.TYPE_SHIFT, avail_M)
+        pairs = select_matching_pairs(w_slots, s_slots, hourly.SHIFT_LENGTH)
+        assert(len(pairs) == 7) # Brief's half hour is no hourly slot
+        assert(sorted(map(repr, pairs)) == sorted(map(repr, select_matching_pairs(w_slots, s_slots))))
+        assert(len(assign_shifts(w_slots, s_slots, interval=hourly.SHIFT_LENGTH)) == 7)
+
+    def test_schedule_analytics(self):
+        from tempfile import TemporaryDirectory
+        import json
+        import os
+
+        workers = [{'name': 'Long', 'hours': '3', 'M': '10:00-12:00'},
+                   {'name': 'Split', 'M': '12:30-13:00, 14:00-15:00'}]
+        position = [{'name': 'Desk', 'M': '10:00-17:00'}]
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER,
+                                                 *[dict(A) for A in workers])
+        s_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT,
+                                                 *[dict(T) for T in position])
+        analytics = analyze_schedule(assign_shifts(w_table, s_table), s_table,
+                                     {ID: w_table.hours.get(ID) for ID in w_table.names},
+                                     w_table.names)
+
+        monday = s_table.day_in_cycle[0]
+        desk = analytics.positions[0]
+        long, split = analytics.employees[0], analytics.employees[1]
+        assert((desk.name, desk.demanded_hours, desk.covered_hours) == ('Desk', 7, 3.5))
+        assert(desk.uncovered == [(monday, 12 * 60, 12 * 60 + 30), (monday, 13 * 60, 14 * 60),
+                                  (monday, 15 * 60, 17 * 60)])
+        assert((long.requested_hours, split.requested_hours) == (3, None))
+        assert((long.assigned_hours, split.assigned_hours) == (2, 1.5))
+        assert(analytics.uncovered_hours == 3.5)
+        assert((long.blocks, split.blocks, analytics.blocks) == (1, 2, 3))
+
+        # Interval assignments are never expanded, and answer the same
+        w_intervals = self.scheduler.make_intervals(ScheduleInterpreter.TYPE_WORKER,
+                                                    *[dict(A) for A in workers])
+        s_intervals = self.scheduler.make_intervals(ScheduleInterpreter.TYPE_SHIFT,
+                                                    *[dict(T) for T in position])
+        by_interval = analyze_schedule(assign_intervals(w_intervals, s_intervals), s_intervals)
+        assert(by_interval.positions[0].uncovered == desk.uncovered)
+        assert(by_interval.uncovered_hours == 3.5 and by_interval.employees[1].blocks == 2)
+
+        # make_matching fills one alongside the table it returns
+        with TemporaryDirectory() as directory:
+            availability_file = os.path.join(directory, "roster.json")
+            self.__write_json__(availability_file, workers)
+
+            # Streamed records too, hours and names are kept as they are read
+            for by_interval, streaming in ((False, False), (True, False), (False, True)):
+                alongside = ScheduleAnalytics()
+                make_matching(availability_file, by_interval=by_interval, streaming=streaming,
+                              shift_templates=position, analytics=alongside,
+                              output=os.path.join(directory, "out.csv"))
+                assert(alongside.as_dict() == analytics.as_dict())
+                assert(alongside.employees[0].requested_hours == 3)
+
+            # Employees nobody assigned are still listed, with what they asked for
+            idle = ScheduleAnalytics()
+            self.__write_json__(availability_file, workers + [{'name': 'Idle', 'hours': '5',
+                                                               'T': '10:00-11:00'}])
+            make_matching(availability_file, streaming=True, shift_templates=position,
+                          analytics=idle, output=os.path.join(directory, "out.csv"))
+            assert(idle.employees[2].as_dict() == {'id': 2, 'name': 'Idle', 'requested_hours': 5,
+                                                   'assigned_hours': 0.0, 'blocks': 0})
+
+    def test_interval_matching(self):
+        workers = (avail_T, avail_WTF, ben_avail, short_avail)
+        slot_table = self.__generate_schedule__(workers)
+
+        w_intervals = self.scheduler.make_intervals(
+            ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_intervals = self.scheduler.make_intervals(
+            ScheduleInterpreter.TYPE_SHIFT, open_position_for_makerspace)
+        interval_table = self.scheduler.make_schedule(
+            assign_intervals(w_intervals, s_intervals))
+
+        def coverage(table):
+            return sum(1 for row in table[1:] for cell in row[1:] if cell is not None)
+
+        # Ben's touching ranges on Monday become one run, Wednesday has a gap
+        assert(len([I for I in w_intervals if I.name == 'Ben S']) == 6)
+        assert(interval_table[0] == slot_table[0])
+        assert(coverage(interval_table) == coverage(slot_table))
+
+    def test_packed_slot_keys(self):
+        # Old string keys collided: "1" + "115" == "11" + "15"
+        A = Slot(1, 0, "A", 115, ScheduleInterpreter.TYPE_WORKER, 0)
+        B = Slot(11, 0, "B", 15, ScheduleInterpreter.TYPE_WORKER, 0)
+        C = Slot(1, 1, "C", 115, ScheduleInterpreter.TYPE_SHIFT, 0)
+
+        assert(A != B)
+        assert(A == C)
+        assert(A < B)
+        assert(int(B) == 11 * 24 * 60 + 15)
+        assert(select_matching_pairs([A, B], [C]) == [(A, C)])
+
+    def test_slot_table(self):
+        workers = (avail_T, avail_WTF, ben_avail)
+        w_slots = self.scheduler.make_slots(ScheduleInterpreter.TYPE_WORKER, *workers)
+        w_table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_table = self.scheduler.make_slot_table(
+            ScheduleInterpreter.TYPE_SHIFT, open_position_for_makerspace)
+
+        assert(len(w_table) == len(w_slots))
+        assert(list(map(repr, w_table)) == list(map(repr, w_slots)))
+        assert(list(w_table.key) == [S.key for S in w_slots])
+
+        table = self.scheduler.make_schedule(assign_shifts(w_table, s_table))
+        goal = self.__generate_schedule__(workers)
+        assert(table[0] == goal[0])
+        assert(len(table) == len(goal))
+
+    def test_memoized_time_ranges(self):
+        early_bird = ScheduleInterpreter(start='6:00')
+
+        assert(self.scheduler.parse_time_range("1pm-5pm") == (13*60, 17*60))
+        assert(self.scheduler.parse_time_range("1-5") == (13*60, 17*60))
+        assert(self.scheduler.parse_time_range("10:00-17:00") == (10*60, 17*60))
+        # Cached results must still honor each interpreter's own FIRST_SHIFT
+        assert(early_bird.parse_time_range("1-5") == (13*60, 17*60))
+        assert(early_bird.parse_time_range("7-11") == (7*60, 11*60))
+        assert(self.scheduler.parse_time_range("7-11") == (19*60, 23*60))
+
+        hits = ScheduleInterpreter.time_range_of.cache_info().hits
+        self.scheduler.parse_time_range("1pm-5pm")
+        assert(ScheduleInterpreter.time_range_of.cache_info().hits == hits + 1)
+
+        try:
+            self.scheduler.timecheck("noon")
+            raise AssertionError("Accepted a time with no digits")
+        except ValueError:
+            pass
+
+    def test_sparse_table(self):
+        cells = [Cell(row=4, col=2, value='B'), Cell(row=1, col=0, value='A'),
+                 Cell(row=4, col=0, value='C')]
+        table = self.scheduler.make_table(cells)
+
+        assert(table == [['A', None, None], ['C', None, 'B']])
+
+        # Two positions on Monday, one of them staffed only in the afternoon
+        W = Slot(0, 0, "Worker", 600, ScheduleInterpreter.TYPE_WORKER, 0)
+        X = Slot(0, 0, "Other", 780, ScheduleInterpreter.TYPE_WORKER, 0)
+        assignments = [
+            (W, Slot(0, 1, "Position", 600, ScheduleInterpreter.TYPE_SHIFT, 0)),
+            (X, Slot(0, 0, "Position", 780, ScheduleInterpreter.TYPE_SHIFT, 0)),
+        ]
+        schedule = self.scheduler.make_schedule(assignments)
+
+        assert(schedule == [["Time of Day", 0, 0],
+                            [600, None, "Worker"],
+                            [780, "Other", None]])
+
     def test_timerange_to_slots(self):
         # From 10 am to 12 pm
         result = self.scheduler.create_TOD_slot_range('10:00', '24:00')
@@ -247,6 +1023,148 @@ class TestMachine():
             log_debug(table)
 
 
+    def test_stream_table_as_csv(self):
+        from io import StringIO
+
+        workers = (avail_T, avail_WTF)
+        w_slots = self.scheduler.make_slots(ScheduleInterpreter.TYPE_WORKER, *workers)
+        s_slots = self.scheduler.make_slots(
+            ScheduleInterpreter.TYPE_SHIFT, open_position_for_makerspace)
+        assignments = assign_shifts(w_slots, s_slots)
+        table = self.scheduler.make_schedule(assignments)
+
+        output = StringIO()
+        rows = self.scheduler.iter_schedule(assignments) # Generator, not a list
+        written = write_CSV(rows, output)
+
+        assert(written == len(table))
+        assert(output.getvalue() == as_CSV(table) + "\n")
+
+
+    def test_disabled_logging_is_lazy(self):
+        from contextlib import redirect_stdout
+        from io import StringIO
+        import logger
+        previous_level, previous_limit = logger.LEVEL, logger.MONITOR_LIMIT
+        calls = []
+
+        def expensive_message():
+            calls.append(1)
+            return "expensive"
+
+        try:
+            logger.set_level('quiet')
+            log_debug(expensive_message)
+            log_verbose("%s", expensive_message)
+            track_var("ignored", calls)
+            assert(calls == [])
+            assert("ignored" not in logger.MONITOR)
+
+            # Names in any case, unknown ones refused before they break a comparison
+            logger.set_level('VERBOSE')
+            assert(logger.VERBOSE and not logger.DEBUG)
+            try:
+                logger.set_level('loud')
+                assert(False)
+            except ValueError:
+                pass
+
+            logger.set_level('debug')
+            logger.MONITOR_LIMIT = 3
+            printed = StringIO()
+            with redirect_stdout(printed):
+                for n in range(logger.MONITOR_LIMIT + 5):
+                    track_var(f"var {n}", n)
+                log_debug(lambda count: f"{count} calls", len(calls))
+                log_debug("%s and %s", "format", "args")
+            assert(len(logger.MONITOR) == logger.MONITOR_LIMIT)
+            assert(f"var {logger.MONITOR_LIMIT + 4}" in logger.MONITOR)
+
+            # Captured rather than printed, one line per record
+            lines = printed.getvalue().splitlines()
+            assert(len(lines) == logger.MONITOR_LIMIT + 5 + 2)
+            assert(lines[0].startswith(">>>") and lines[0].endswith(":var 0 = 0"))
+            assert(lines[-2:] == ["0 calls", "format and args"])
+        finally:
+            logger.MONITOR.clear()
+            logger.MONITOR_LIMIT = previous_limit
+            logger.set_level(previous_level)
+
+
+    def test_streaming_ingestion(self):
+        from io import StringIO
+        from tempfile import TemporaryDirectory
+        import copy
+        import json
+        import os
+
+        workers = [avail_T, avail_WTF, ben_avail, short_avail]
+        as_array = json.dumps(workers, indent=1)
+        as_lines = "\n".join(map(json.dumps, workers)) + "\n"
+
+        # Tiny chunks so records straddle every read boundary
+        for text in [as_array, as_lines]:
+            records = list(iter_availability(StringIO(text), chunk_size=3))
+            assert(records == json.loads(as_array))
+
+        s_table = self.scheduler.make_slot_table(
+            ScheduleInterpreter.TYPE_SHIFT, open_position_for_makerspace)
+        records = iter_availability(StringIO(as_lines))
+        table = self.scheduler.make_schedule(
+            stream_assign_shifts(self.scheduler, records, s_table))
+        goal = self.__generate_schedule__(copy.deepcopy(workers))
+
+        assert(table[0] == goal[0])
+        assert(len(table) == len(goal))
+
+        # make_matching writes streamed rows as they come, the table is never held
+        with TemporaryDirectory() as directory:
+            lines_file, array_file, streamed, solved = (os.path.join(directory, name)
+                for name in ("roster.jsonl", "roster.json", "a.csv", "b.csv"))
+            for path, text in ((lines_file, as_lines), (array_file, as_array)):
+                with open(path, 'w') as roster:
+                    roster.write(text)
+
+            written = make_matching(lines_file, output=streamed, streaming=True)
+            table = make_matching(array_file, output=solved)
+            with open(streamed) as streamed_file, open(solved) as solved_file:
+                assert(streamed_file.read() == solved_file.read())
+            assert(written == len(table))
+
+        try:
+            list(iter_availability(StringIO('[{"name": "A"}, {"name"')))
+            raise AssertionError("Accepted a truncated availability file")
+        except ValueError: # JSONDecodeError is a ValueError
+            pass
+
+
+    def test_batch_of_sites(self):
+        from tempfile import TemporaryDirectory
+        import json
+        import os
+
+        with TemporaryDirectory() as directory:
+            site_a = os.path.join(directory, "site_a.json")
+            site_b = os.path.join(directory, "site_b.json")
+            self.__write_json__(site_a, [avail_T, avail_WTF])
+            self.__write_json__(site_b, [ben_avail])
+
+            mornings = [{'name': 'Desk', 'M': '10:00-12:00'}]
+            jobs = [
+                BatchJob(site_a),
+                BatchJob(site_b, mornings, os.path.join(directory, "b.csv")),
+                BatchJob(os.path.join(directory, "missing.json")),
+            ]
+            results = run_batch(jobs, workers=2)
+
+            assert([R.job.availability_file for R in results] == [J.availability_file for J in jobs])
+            assert(results[0].error is None and results[1].error is None)
+            assert(results[2].error.startswith("FileNotFoundError"))
+            assert(os.path.exists(os.path.join(directory, "site_a_schedule.csv")))
+            assert(results[1].rows == 1 + 8) # Headers and 10:00 to 11:45
+            assert(mornings == [{'name': 'Desk', 'M': '10:00-12:00'}]) # Not modified
+
+
     def test_group_sequential_ranges(self):
         A = list(range(0, 100, 1))
         B = list(range(40, 80, 1))
@@ -0,0 +1,89 @@
+# BATCH.PY
+#
+# Solve many independent schedules, e.g. one per site, on a process pool
+# Each job names its own availability file, shift templates and output,
+# so jobs never share a path and can run side by side
+#
+# Usage: python3 batch.py jobs.json [--workers N]
+# where jobs.json is a list of objects like
+#   {"availability": "site1.json", "shifts": [{...}, ...], "output": "site1.csv"}
+# "shifts" and "output" are optional, see BatchJob
+from concurrent.futures import ProcessPoolExecutor
+from matcher import make_matching
+from time import perf_counter
+
+import json
+import os
+import sys
+
+
+class BatchJob():
+    """ Purely a data object, one schedule to solve """
+    def __init__(self, availability_file, shift_templates=None, output=None, **options):
+        self.availability_file = availability_file
+        self.shift_templates = shift_templates
+        # Default output sits next to the input, e.g. site1.json -> site1_schedule.csv
+        self.output = output or os.path.splitext(availability_file)[0] + "_schedule.csv"
+        self.options = options # Passed through to make_matching
+
+class JobResult():
+    """ Purely a data object, what happened to one BatchJob """
+    def __init__(self, job, rows=0, seconds=0.0, error=None):
+        self.job = job
+        self.rows = rows
+        self.seconds = seconds
+        self.error = error
+
+    def __repr__(self):
+        outcome = self.error or f"{self.rows} rows"
+        return f"{self.job.availability_file}: {outcome} in {self.seconds:.3f}s"
+
+
+# Runs in a worker process, failures are reported instead of raised
+# so one bad site never takes down the rest of the batch
+def run_job(job):
+    start = perf_counter()
+
+    try:
+        table = make_matching(job.availability_file, output=job.output,
+                              shift_templates=job.shift_templates, **job.options)
+        rows = table if isinstance(table, int) else len(table) # Streamed, see make_matching
+        return JobResult(job, rows, perf_counter() - start)
+
+    except Exception as e:
+        return JobResult(job, 0, perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+# RETURN list of JobResult in the same order as jobs
+# workers=None uses every core, workers=1 runs in this process
+def run_batch(jobs, workers=None):
+    jobs = list(jobs)
+
+    if workers == 1:
+        return list(map(run_job, jobs))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_job, jobs))
+
+
+def load_jobs(jobs_file):
+    with open(jobs_file, 'r') as file:
+        descriptions = json.load(file)
+
+    return [BatchJob(D.pop("availability"), D.pop("shifts", None), D.pop("output", None), **D)
+                for D in descriptions]
+
+
+if __name__ == '__main__':
+    workers = None
+
+    if '--workers' in sys.argv:
+        workers = int(sys.argv[sys.argv.index('--workers') + 1])
+
+    start = perf_counter()
+    results = run_batch(load_jobs(sys.argv[1]), workers)
+
+    for result in results:
+        print(result)
+
+    print(f"{len(results)} jobs in {perf_counter() - start:.3f}s")
@@ -0,0 +1,240 @@
+# BENCHMARK.PY
+#
+# Timing harness for the scheduling pipeline on synthetic rosters
+# Every stage is named after the function it times, timed over several
+# runs and its peak memory recorded. Results can be saved as a JSON
+# baseline and later runs compared against it by their median
+#
+# Usage:
+#   python3 benchmark.py                        run the default scenarios
+#   python3 benchmark.py --save base.json       ... and keep them as a baseline
+#   python3 benchmark.py --compare base.json    flag stages slower than baseline
+#   python3 benchmark.py --employees 300 1000 --positions 2 --shift-length 15 30
+#   python3 benchmark.py --backend python pipe     compare solver backends
+#   python3 benchmark.py --repeat 9             more runs per stage, steadier medians
+#   python3 benchmark.py --slot-keys            packed slot keys against comparisons
+from scheduler import ScheduleInterpreter
+from matcher import decide_matching, merge_matching_rows, select_matching_pairs, write_CSV
+from io import StringIO
+from operator import attrgetter
+from statistics import median
+from time import perf_counter
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import tracemalloc
+
+STAGES = ['make_slot_table', 'merge_matching_rows', 'decide_matching', 'make_schedule', 'write_CSV']
+
+
+# Random but repeatable availabilities
+#   density        chance an employee is available on a given day
+#   fragmentation  number of separate ranges per available day
+def make_roster(num_employees, seed=0, density=0.7, fragmentation=1):
+    generator = random.Random(seed)
+    roster = list()
+
+    for E in range(num_employees):
+        avail = {'name': f"Employee {E}", 'hours': str(generator.randrange(4, 20))}
+
+        for day in ScheduleInterpreter.DOW:
+            if generator.random() >= density:
+                continue
+
+            # Split the day at random quarter hours, keep every other piece
+            start = generator.randrange(10, 16) * 60
+            end = generator.randrange(start // 60 + 1, 18) * 60
+            cuts = sorted(generator.sample(range(start + 15, end, 15),
+                                           min(2 * fragmentation - 2, (end - start) // 15 - 1)))
+            edges = [start] + cuts + [end]
+            pieces = [f"{a // 60}:{a % 60:02}-{b // 60}:{b % 60:02}"
+                        for a, b in zip(edges[::2], edges[1::2])]
+            avail[day] = ', '.join(pieces)
+
+        roster.append(avail)
+
+    return roster
+
+
+def make_positions(num_positions):
+    all_day = '10:00-17:00'
+    return [dict({'name': 'Open Position'}, **{D: all_day for D in ScheduleInterpreter.DOW})
+                for P in range(num_positions)]
+
+
+# Best of several runs of a callable, in milliseconds
+def time_it(procedure, repeat=5):
+    best = float('inf')
+
+    for R in range(repeat):
+        start = perf_counter()
+        procedure()
+        best = min(best, perf_counter() - start)
+
+    return best * 1000
+
+
+# Time repeat runs of one stage, then one more under tracemalloc for its peak memory
+# Tracing slows Python code down several times, so it never shares a run with the clock
+# ms is the median run, the one regressions are judged by, min_ms the fastest
+# RETURN 2-tuple of the stage's result and its measurements
+def measure(procedure, memory=True, repeat=5):
+    runs = list()
+
+    for R in range(max(1, repeat)):
+        start = perf_counter()
+        result = procedure()
+        runs.append((perf_counter() - start) * 1000)
+
+    measured = {'ms': median(runs), 'min_ms': min(runs), 'runs': len(runs)}
+
+    if memory:
+        tracemalloc.start()
+        procedure()
+        measured['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    return result, measured
+
+
+def run_scenario(employees=300, positions=2, shift_length=15, density=0.7, fragmentation=1,
+                 memory=True, backend='python', repeat=5):
+    scheduler = ScheduleInterpreter(shift_len=shift_length)
+    roster = make_roster(employees, density=density, fragmentation=fragmentation)
+    templates = make_positions(positions)
+    stages = dict()
+
+    def make_slots():
+        return (scheduler.make_slot_table(ScheduleInterpreter.TYPE_WORKER, *roster),
+                scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT, *templates))
+
+    (w_table, s_table), stages['make_slot_table'] = measure(make_slots, memory, repeat)
+    first_shift = len(w_table)
+    (u, v, weights), stages['merge_matching_rows'] = measure(
+        lambda: merge_matching_rows(w_table, s_table, first_shift), memory, repeat)
+
+    matched, stages['decide_matching'] = measure(
+        lambda: decide_matching(zip(u, v, weights), backend=backend), memory, repeat)
+
+    assignments = [(w_table[w], s_table[s - first_shift]) for w, s in matched]
+    table, stages['make_schedule'] = measure(
+        lambda: scheduler.make_schedule(assignments), memory, repeat)
+    # Into memory, so the stage is the writer make_matching uses and not the disk
+    rows, stages['write_CSV'] = measure(lambda: write_CSV(table, StringIO()), memory, repeat)
+
+    return {
+        'parameters': {'employees': employees, 'positions': positions,
+                       'shift_length': shift_length, 'density': density,
+                       'fragmentation': fragmentation, 'backend': backend},
+        'counts': {'slots': len(w_table) + len(s_table), 'edges': len(u),
+                   'matched': len(matched)},
+        'stages': stages
+    }
+
+
+def scenario_name(parameters):
+    return ','.join(f"{key}={value}" for key, value in sorted(parameters.items()))
+
+
+# Stages slower than baseline by more than tolerance, e.g. 0.2 for 20%
+# Stages under min_ms in both runs are too noisy to judge
+# RETURN list of (scenario, stage, baseline ms, current ms)
+def find_regressions(baseline, current, tolerance=0.2, min_ms=1.0):
+    regressions = list()
+    before = {scenario_name(R['parameters']): R['stages'] for R in baseline}
+
+    for result in current:
+        name = scenario_name(result['parameters'])
+
+        for stage, measured in result['stages'].items():
+            reference = before.get(name, {}).get(stage)
+
+            if reference is None or max(reference['ms'], measured['ms']) < min_ms:
+                continue
+
+            if measured['ms'] > reference['ms'] * (1 + tolerance):
+                regressions.append((name, stage, reference['ms'], measured['ms']))
+
+    return regressions
+
+
+# Packed keys versus comparison operators, see Slot.key
+def bench_slot_keys(num_employees=300, num_positions=3, repeat=5):
+    scheduler = ScheduleInterpreter()
+    w_slots = scheduler.make_slots(ScheduleInterpreter.TYPE_WORKER, *make_roster(num_employees))
+    s_slots = scheduler.make_slots(ScheduleInterpreter.TYPE_SHIFT, *make_positions(num_positions))
+    slots = w_slots + s_slots
+
+    return {
+        'slots': len(slots),
+        'sort by packed key (ms)': time_it(lambda: sorted(slots, key=attrgetter("key")), repeat),
+        'sort by comparisons (ms)': time_it(lambda: sorted(slots), repeat),
+        'hash-join (ms)': time_it(lambda: select_matching_pairs(w_slots, s_slots,
+                                                               scheduler.SHIFT_LENGTH), repeat),
+    }
+
+
+def print_result(result):
+    print(scenario_name(result['parameters']), result['counts'])
+
+    for stage in STAGES:
+        measured = result['stages'][stage]
+        peak = f"{measured['peak_kb']:>12.0f} KiB" if 'peak_kb' in measured else ''
+        print(f"    {stage:<24}{measured['ms']:>10.1f} ms{peak}")
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description="Benchmark the scheduling pipeline")
+    parser.add_argument('--employees', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--positions', type=int, nargs='+', default=[2])
+    parser.add_argument('--shift-length', type=int, nargs='+', default=[15])
+    parser.add_argument('--density', type=float, nargs='+', default=[0.7])
+    parser.add_argument('--fragmentation', type=int, nargs='+', default=[1])
+    parser.add_argument('--backend', nargs='+', default=['python'], help="see solvers.BACKENDS")
+    parser.add_argument('--save', help="write results to this JSON baseline")
+    parser.add_argument('--compare', help="flag regressions against this JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc runs")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per stage")
+    parser.add_argument('--slot-keys', action='store_true',
+                        help="time sorting and joining slots instead of the pipeline")
+    options = parser.parse_args(arguments)
+
+    if options.slot_keys:
+        for employees, positions in itertools.product(options.employees, options.positions):
+            print(f"employees={employees},positions={positions}",
+                  bench_slot_keys(employees, positions, options.repeat))
+
+        return 0
+
+    results = list()
+    grid = itertools.product(options.employees, options.positions, options.shift_length,
+                             options.density, options.fragmentation, options.backend)
+
+    for employees, positions, shift_length, density, fragmentation, backend in grid:
+        result = run_scenario(employees, positions, shift_length, density, fragmentation,
+                              not options.no_memory, backend, options.repeat)
+        print_result(result)
+        results.append(result)
+
+    if options.save:
+        with open(options.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1)
+
+    if options.compare:
+        with open(options.compare, 'r') as baseline_file:
+            regressions = find_regressions(json.load(baseline_file), results, options.tolerance)
+
+        for name, stage, before, after in regressions:
+            print(f"REGRESSION {name} {stage}: {before:.1f} ms -> {after:.1f} ms")
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,435 @@
+# BIPARTITE.PY
+#
+# In-process solvers for the Job Matching problem built by MATCHER.PY
+# Edges are 3-tuples (u, v, weight) where u is a worker vertex and
+# v is a shift vertex, same as the lines of a solver input file
+#
+# Two engines are provided:
+#   Hopcroft-Karp for maximum cardinality when weights carry no information
+#   Successive shortest paths for maximum cardinality with maximum weight,
+#     which is what the old external solver was asked for with --max
+#
+# Slot graphs fall apart into many small connected components, one per
+# time of day, so match_by_components solves each of them on its own
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
+from operator import itemgetter
+from time import perf_counter
+
+import os
+
+
+class ComponentReport():
+    """ Purely a data object, how solving one connected component went """
+    def __init__(self, vertices, edges, matched, seconds):
+        self.vertices = vertices
+        self.edges = edges
+        self.matched = matched
+        self.seconds = seconds
+
+    def __repr__(self):
+        return (f"{self.vertices} vertices, {self.edges} edges, "
+                f"{self.matched} matched in {self.seconds * 1000:.2f}ms")
+
+class ApproximateReport(ComponentReport):
+    """ Purely a data object, an approximate solve and how far from optimal it can be """
+    def __init__(self, vertices, edges, matched, seconds, upper_bound):
+        super().__init__(vertices, edges, matched, seconds)
+        self.upper_bound = upper_bound
+
+    # Fraction of the best possible coverage that is guaranteed
+    @property
+    def ratio(self):
+        return self.matched / self.upper_bound if self.upper_bound else 1.0
+
+    def __repr__(self):
+        return (super().__repr__() + f", at least {self.ratio:.1%} of "
+                f"the maximum of at most {self.upper_bound}")
+
+
+# Group edges by worker vertex, keeping the best weight for repeated pairs
+# RETURN dict of u -> dict of v -> weight
+def adjacency_of(edges):
+    adjacent = dict()
+
+    for u, v, weight in edges:
+        neighbors = adjacent.setdefault(u, dict())
+
+        if neighbors.get(v, weight) <= weight:
+            neighbors[v] = weight
+
+    return adjacent
+
+
+# Maximum cardinality matching, weights are ignored
+# RETURN list of (u, v) matched pairs
+def hopcroft_karp(edges):
+    return hopcroft_karp_on(adjacency_of(edges))
+
+
+# Breadth-first layering followed by iterative depth-first augmenting,
+# so deep graphs never hit the recursion limit
+def hopcroft_karp_on(adjacency):
+    adjacent = {u: list(neighbors) for u, neighbors in adjacency.items()}
+    mate_u = dict.fromkeys(adjacent)
+    mate_v = dict()
+
+    augment_in_phases(adjacent, mate_u, mate_v)
+
+    return [(u, v) for u, v in mate_u.items() if v is not None]
+
+
+# Hopcroft-Karp style phases on a matching given as mate_u and mate_v, changed in place
+# Every phase augments along a maximal set of disjoint shortest augmenting paths,
+# and may take longer ones its depth-first search meets on the last layer,
+# so these are not strict shortest-path phases. The length of the shortest
+# path left is measured afresh after every phase, bounds taken from it hold
+# keep_going, if given, is asked after every phase with the length of the
+# shortest augmenting path left and stops the phases by returning False
+# RETURN edges on the shortest augmenting path left after at most
+#   phases phases, None once the matching is maximum
+def augment_in_phases(adjacent, mate_u, mate_v, phases=None, keep_going=None):
+    unreached = float('inf')
+
+    def layer_free_vertices():
+        layers = dict()
+        queue = [u for u in adjacent if mate_u[u] is None]
+        shortest = None
+
+        for u in queue:
+            layers[u] = 0
+
+        for u in queue: # queue grows while iterating, breadth-first
+            if shortest is not None and layers[u] >= shortest:
+                break # Layers stop at the shortest length found
+
+            for v in adjacent[u]:
+                w = mate_v.get(v)
+
+                if w is None:
+                    shortest = layers[u] + 1
+                elif w not in layers:
+                    layers[w] = layers[u] + 1
+                    queue.append(w)
+
+        return layers, shortest
+
+    def augment_from(root, layers):
+        path = [root]
+        edge_index = {root: 0}
+
+        while path:
+            u = path[-1]
+            neighbors = adjacent[u]
+
+            if edge_index[u] == len(neighbors):
+                layers[u] = unreached # Dead end for the rest of the phase
+                path.pop()
+                continue
+
+            v = neighbors[edge_index[u]]
+            edge_index[u] += 1
+            w = mate_v.get(v)
+
+            if w is None:
+                # Flip every edge along the path
+                for u in reversed(path):
+                    v, mate_u[u] = mate_u[u], v
+                    mate_v[mate_u[u]] = u
+                return True
+
+            if layers.get(w, unreached) == layers[u] + 1:
+                edge_index[w] = 0
+                path.append(w)
+
+        return False
+
+    layers, shortest = layer_free_vertices()
+    phase = 0
+
+    while shortest is not None and phase != phases:
+        for u in adjacent:
+            if mate_u[u] is None:
+                augment_from(u, layers)
+
+        layers, shortest = layer_free_vertices()
+        phase += 1
+
+        if keep_going is not None and shortest is not None:
+            if not keep_going(2 * shortest - 1):
+                break
+
+    return None if shortest is None else 2 * shortest - 1
+
+
+# Fast approximate matching for very large graphs: greedy by weight, heaviest
+# edges first, then a few Hopcroft-Karp style phases of short augmenting paths.
+# Once the shortest augmenting path left has 2k + 1 edges, the matching has
+# at least k / (k + 1) of the maximum. Phases here need not raise k by one
+# each, so no ratio follows from their number: the report's bound is
+# recomputed from the shortest path left after each run
+# A list passed as report gets one ApproximateReport
+# RETURN list of (u, v) matched pairs
+def approximate_matching(edges, phases=2, report=None):
+    return anytime_matching(edges, phases=phases, refine_weights=False, report=report)
+
+
+# Best matching found by a deadline, given in perf_counter seconds
+# Starts from greedy by weight and improves it in steps: Hopcroft-Karp
+# phases until coverage is maximum, then an exact weighted solve of one
+# connected component after another. Between steps it stops for the
+# deadline or once cancel, e.g. a threading.Event, is set, and calls
+# progress with an ApproximateReport of the matching so far.
+# Without a deadline the result is the same as match_by_components
+# A list passed as report gets one ApproximateReport, upper_bound minus
+# matched is how many more slots could at most be covered
+# RETURN list of (u, v) matched pairs
+def anytime_matching(edges, deadline=None, progress=None, cancel=None, phases=None,
+                     refine_weights=True, report=None):
+    start = perf_counter()
+    by_weight = sorted(edges, key=itemgetter(2), reverse=True)
+    mate_u = dict()
+    mate_v = dict()
+
+    for u, v, weight in by_weight:
+        if u not in mate_u and v not in mate_v:
+            mate_u[u] = v
+            mate_v[v] = u
+
+    # Every matched pair takes one vertex of each side, no matching outgrows either
+    worker_vertices = set(map(itemgetter(0), by_weight))
+    shift_vertices = set(map(itemgetter(1), by_weight))
+    upper_bound = min(len(worker_vertices), len(shift_vertices))
+
+    def snapshot():
+        return ApproximateReport(len(worker_vertices) + len(shift_vertices), len(by_weight),
+                                 len(mate_v), perf_counter() - start, upper_bound)
+
+    def stopped():
+        return ((deadline is not None and perf_counter() >= deadline)
+                or (cancel is not None and cancel.is_set()))
+
+    def tighten(shortest):
+        nonlocal upper_bound
+        k = (shortest - 1) // 2
+        upper_bound = min(upper_bound, len(mate_v) * (k + 1) // k)
+
+    def keep_going(shortest):
+        tighten(shortest)
+
+        if progress is not None:
+            progress(snapshot())
+
+        return not stopped()
+
+    if progress is not None:
+        progress(snapshot())
+
+    if len(mate_v) < upper_bound and not stopped():
+        adjacent = {u: list() for u in worker_vertices}
+        for u, v, weight in by_weight:
+            adjacent[u].append(v)
+
+        greedy, mate_u = mate_u, dict.fromkeys(adjacent)
+        mate_u.update(greedy)
+        shortest = augment_in_phases(adjacent, mate_u, mate_v, phases, keep_going)
+
+        if shortest is None:
+            upper_bound = len(mate_v)
+        else:
+            tighten(shortest)
+
+    # Coverage is maximum, now trade greedy pairs for the heaviest ones
+    weights = set(map(itemgetter(2), by_weight))
+
+    if refine_weights and len(mate_v) == upper_bound and len(weights) > 1:
+        for component in connected_components(adjacency_of(by_weight)):
+            if stopped():
+                break
+
+            pairs, component_report = solve_component(component, True)
+
+            for u in component:
+                v = mate_u.pop(u, None)
+                if v is not None:
+                    del mate_v[v]
+
+            for u, v in pairs:
+                mate_u[u] = v
+                mate_v[v] = u
+
+        if progress is not None:
+            progress(snapshot())
+
+    matching = [(u, v) for u, v in mate_u.items() if v is not None]
+
+    if report is not None:
+        report.append(snapshot())
+
+    return matching
+
+
+# Maximum cardinality matching of greatest total weight among those
+# RETURN list of (u, v) matched pairs
+def max_weight_matching(edges):
+    return max_weight_matching_on(adjacency_of(edges))
+
+
+# Successive shortest paths on costs of -weight with Dijkstra and potentials
+def max_weight_matching_on(adjacent):
+    mate_u = dict.fromkeys(adjacent)
+    mate_v = dict()
+    sink = object()
+
+    # Potentials keep reduced costs non-negative for Dijkstra
+    potential = dict.fromkeys(adjacent, 0)
+    for neighbors in adjacent.values():
+        for v, weight in neighbors.items():
+            potential[v] = min(potential.get(v, -weight), -weight)
+    potential[sink] = min(potential[v] for v in potential if v not in adjacent) \
+        if len(potential) > len(adjacent) else 0
+
+    while True:
+        distance = dict()
+        previous = dict()
+        heap = list()
+        order = 0 # Tie-breaker so vertices themselves are never compared
+
+        for u in adjacent:
+            if mate_u[u] is None:
+                distance[u] = 0
+                heappush(heap, (0, order, u))
+                order += 1
+
+        settled = set()
+        while heap:
+            d, _, x = heappop(heap)
+            if x in settled:
+                continue
+            settled.add(x)
+
+            if x is sink:
+                break
+
+            if x in adjacent: # Worker vertex, follow unmatched edges
+                arcs = ((v, -weight) for v, weight in adjacent[x].items()
+                            if mate_u[x] != v)
+            elif x in mate_v: # Matched shift vertex, go back along its edge
+                u = mate_v[x]
+                arcs = [(u, adjacent[u][x])]
+            else: # Free shift vertex can finish a path
+                arcs = [(sink, 0)]
+
+            for y, cost in arcs:
+                reduced = d + cost + potential[x] - potential[y]
+                if reduced < distance.get(y, reduced + 1):
+                    distance[y] = reduced
+                    previous[y] = x
+                    heappush(heap, (reduced, order, y))
+                    order += 1
+
+        if sink not in settled:
+            break
+
+        limit = distance[sink]
+        for x in potential:
+            potential[x] += min(distance.get(x, limit), limit)
+
+        # Walk back from the sink, flipping matched and unmatched edges
+        v = previous[sink]
+        while v is not None:
+            u = previous[v]
+            next_v = mate_u[u]
+            mate_u[u] = v
+            mate_v[v] = u
+            v = next_v
+
+    return [(u, v) for u, v in mate_u.items() if v is not None]
+
+
+# Choose the cheapest engine that answers the question
+# With uniform weights every maximum matching is also of maximum weight
+# Edges may be a generator, they are consumed once into the adjacency
+# RETURN list of (u, v) matched pairs
+def match_bipartite_graph(edges, maximize_weight=True):
+    return match_adjacency(adjacency_of(edges), maximize_weight)
+
+
+def match_adjacency(adjacent, maximize_weight=True):
+    weights = set(W for neighbors in adjacent.values() for W in neighbors.values())
+
+    if maximize_weight and len(weights) > 1:
+        return max_weight_matching_on(adjacent)
+
+    return hopcroft_karp_on(adjacent)
+
+
+# Split an adjacency into connected components with union-find
+# Worker and shift vertices share one namespace, as in the solver files
+# RETURN list of adjacencies, one per component
+def connected_components(adjacent):
+    parent = dict()
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]] # Path halving
+            x = parent[x]
+
+        return x
+
+    for u, neighbors in adjacent.items():
+        root = find(parent.setdefault(u, u))
+
+        for v in neighbors:
+            other = parent.get(v)
+
+            if other is None: # First sight of this shift vertex
+                parent[v] = root
+            elif other != root: # Common case is already in this component
+                other = find(other)
+                if other != root:
+                    parent[other] = root
+
+    components = dict()
+
+    for u, neighbors in adjacent.items():
+        components.setdefault(find(u), dict())[u] = neighbors
+
+    return list(components.values())
+
+
+# Solve one component, timed, see match_by_components
+# RETURN 2-tuple of matched pairs and its ComponentReport
+def solve_component(adjacent, maximize_weight=True):
+    start = perf_counter()
+    matching = match_adjacency(adjacent, maximize_weight)
+    vertices = len(adjacent) + len(set().union(*adjacent.values()))
+    edges = sum(map(len, adjacent.values()))
+
+    return matching, ComponentReport(vertices, edges, len(matching), perf_counter() - start)
+
+
+# Same result as match_bipartite_graph, one solve per connected component
+# workers > 1 spreads components over a process pool
+# A list passed as report is extended with one ComponentReport per component
+# RETURN list of (u, v) matched pairs
+def match_by_components(edges, maximize_weight=True, workers=1, report=None):
+    components = connected_components(adjacency_of(edges))
+    flags = [maximize_weight] * len(components)
+
+    if workers == 1 or len(components) < 2:
+        solved = list(map(solve_component, components, flags))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(components) // (4 * (workers or os.cpu_count() or 1)))
+            solved = list(pool.map(solve_component, components, flags, chunksize=chunk))
+
+    matching = list()
+
+    for pairs, component_report in solved:
+        matching += pairs
+
+        if report is not None:
+            report.append(component_report)
+
+    return matching
@@ -0,0 +1,147 @@
+# BITSETS.PY
+#
+# Weekly availability as one Python int per owner, bit c set when the owner
+# is there for cell c, the interval starting at minute c * interval of the
+# cycle. At the default 15 minutes a week is 7 * 96 = 672 bits
+#
+# Overlap of two owners, coverage of a whole roster and "who is free at T"
+# are then single bitwise operations instead of walks over slot lists.
+# Equal slot keys always land in the same cell, so a cell missing on one
+# side rules a slot out of either join, see matcher.select_matching_pairs
+# and matcher.merge_matching_rows
+from scheduler import ScheduleInterpreter, Slot
+
+from functools import reduce
+from itertools import repeat
+from operator import floordiv, or_
+
+
+class AvailabilityBits():
+    """ One bitset per owner, all cut into cells of the same interval """
+
+    def __init__(self, interval=ScheduleInterpreter.SHIFT_LENGTH):
+        self.interval = interval
+        self.bits = dict()  # owner ID -> int
+        self.names = dict() # owner ID -> name
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __getitem__(self, ID):
+        return self.bits.get(ID, 0)
+
+    def cell_of(self, day_in_cycle, time_of_day):
+        return (day_in_cycle * Slot.MINUTES_PER_DAY + time_of_day) // self.interval
+
+    # Cells of [start, end) on one day, a partly covered last cell counts
+    def mask(self, day_in_cycle, start, end):
+        first = self.cell_of(day_in_cycle, start)
+        cells = -(-(end - start) // self.interval)
+
+        return ((1 << cells) - 1) << first
+
+    def add_run(self, ID, day_in_cycle, start, end, name=None):
+        self.bits[ID] = self.bits.get(ID, 0) | self.mask(day_in_cycle, start, end)
+
+        if name is not None:
+            self.names[ID] = name
+
+    def add_keys(self, ID, keys):
+        self.bits[ID] = self.bits.get(ID, 0) | keys_to_bits(keys, self.interval)
+
+
+    @classmethod
+    def from_intervals(cls, intervals, interval=ScheduleInterpreter.SHIFT_LENGTH):
+        bits = cls(interval)
+
+        for I in intervals:
+            bits.add_run(I.ID, I.day_in_cycle, I.start, I.end, I.name)
+
+        return bits
+
+    @classmethod
+    def from_slots(cls, slots, interval=ScheduleInterpreter.SHIFT_LENGTH):
+        bits = cls(interval)
+        keys_by_owner = dict()
+
+        for S in slots:
+            keys_by_owner.setdefault(S.ID, []).append(S.key)
+            bits.names[S.ID] = S.name
+
+        for ID, keys in keys_by_owner.items():
+            bits.add_keys(ID, keys)
+
+        return bits
+
+    @classmethod
+    def from_table(cls, table, interval=ScheduleInterpreter.SHIFT_LENGTH):
+        bits = cls(interval)
+        keys_by_owner = dict()
+
+        for ID, key in zip(table.owner, table.key):
+            keys_by_owner.setdefault(ID, []).append(key)
+
+        for ID, keys in keys_by_owner.items():
+            bits.add_keys(ID, keys)
+        bits.names.update(table.names)
+
+        return bits
+
+
+    # Every cell at least one owner is there for
+    def coverage(self):
+        return reduce(or_, self.bits.values(), 0)
+
+    # Cells both owners are there for
+    def overlap(self, a, b):
+        return self[a] & self[b]
+
+    # RETURN owners there for any cell of mask, in the order they were added
+    def overlapping(self, mask):
+        return [ID for ID, bits in self.bits.items() if bits & mask]
+
+    # RETURN owners there for the cell holding day_in_cycle, time_of_day
+    def free_at(self, day_in_cycle, time_of_day):
+        return self.overlapping(1 << self.cell_of(day_in_cycle, time_of_day))
+
+    def hours(self, ID):
+        return self[ID].bit_count() * self.interval / 60
+
+    # Yield (day_in_cycle, start, end) of every run of set cells in mask
+    # Runs across midnight are split there, like the rest of the scheduler
+    def runs(self, mask):
+        interval = self.interval
+        position = 0
+
+        while mask:
+            skip = (mask & -mask).bit_length() - 1
+            mask >>= skip
+            length = (~mask & (mask + 1)).bit_length() - 1
+            mask >>= length
+
+            start = (position + skip) * interval
+            end = start + length * interval
+            position += skip + length
+
+            while start < end:
+                day_in_cycle, time_of_day = divmod(start, Slot.MINUTES_PER_DAY)
+                day_end = min(end, (day_in_cycle + 1) * Slot.MINUTES_PER_DAY)
+                yield day_in_cycle, time_of_day, day_end - day_in_cycle * Slot.MINUTES_PER_DAY
+                start = day_end
+
+
+# RETURN int with the cell of every slot key set
+def keys_to_bits(keys, interval=ScheduleInterpreter.SHIFT_LENGTH):
+    return sum(1 << cell for cell in set(map(floordiv, keys, repeat(interval))))
+
+
+# RETURN bytes of width cells, 1 where mask has the cell set, so a slot's cell
+# is tested with one index at C speed instead of shifting a big int per slot
+def bits_to_bytes(mask, width):
+    return bytes(mask >> cell & 1 for cell in range(width))
+
+
+# Bitsets straight from availabilities or shift templates, one per schedule
+def make_bitsets(scheduler, type_id, *schedules):
+    return AvailabilityBits.from_intervals(scheduler.make_intervals(type_id, *schedules),
+                                           scheduler.SHIFT_LENGTH)
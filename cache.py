@@ -0,0 +1,108 @@
+# CACHE.PY
+#
+# Content-addressed on-disk cache of solved schedules
+# The key is a hash of everything that decides the result: sanitized
+# availabilities, shift templates and interpreter settings. Identical
+# requests then cost one file read instead of a solve
+#
+# Entries are evicted least recently used first once the directory
+# grows past max_bytes, using file modification times as the clock
+from hashlib import sha256
+
+import json
+import os
+
+# Bump when the stored layout or the solver's choices change
+CACHE_FORMAT = 1
+
+
+class ScheduleCache():
+    """ One directory of JSON tables named by the hash of their inputs """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    @staticmethod
+    def key_for(*inputs):
+        """ Hash any JSON-serializable inputs, dict key order does not matter """
+        canonical = json.dumps([CACHE_FORMAT, inputs], sort_keys=True,
+                               separators=(',', ':'), default=str)
+
+        return sha256(canonical.encode('utf-8')).hexdigest()
+
+
+    def path_of(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+
+    def get(self, key):
+        """ RETURN the cached table, or None on a miss """
+        path = self.path_of(key)
+
+        try:
+            with open(path, 'r') as entry:
+                table = json.load(entry)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        os.utime(path) # Now the most recently used
+        self.hits += 1
+
+        return table
+
+
+    def put(self, key, table):
+        path = self.path_of(key)
+        partial = f"{path}.{os.getpid()}.tmp"
+
+        # Write then rename, so readers never see half an entry
+        with open(partial, 'w') as entry:
+            json.dump(table, entry, separators=(',', ':'))
+        os.replace(partial, path)
+
+        self.evict()
+
+
+    def entries(self):
+        """ RETURN list of (last used, size, path), oldest first """
+        found = list()
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                status = entry.stat()
+                found.append((status.st_mtime, status.st_size, entry.path))
+
+        return sorted(found)
+
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for used, size, path in entries)
+
+        for used, size, path in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError: # Another process got there first
+                pass
+
+            total -= size
+
+
+    def stats(self):
+        entries = self.entries()
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for used, size, path in entries)
+        }
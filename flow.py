@@ -0,0 +1,185 @@
+# FLOW.PY
+#
+# Min-cost flow for scheduling problems that matching alone can not express,
+# e.g. every employee's desired hours, see matcher.assign_by_hours
+#
+# Primal-dual successive shortest paths: Dijkstra on reduced costs finds the
+# cheapest path cost, then a blocking flow pushes as many units as possible
+# along arcs of exactly that cost before the next Dijkstra. Scheduling costs
+# take only a few distinct values, so there are only a handful of phases
+from collections import deque
+from heapq import heappush, heappop
+
+
+class MinCostFlow():
+    """
+    Directed network with capacities and integer costs per unit
+    Arcs are stored in flat lists, arc a ^ 1 is the residual twin of arc a """
+
+    def __init__(self):
+        self.arcs_of = list() # node -> arc ids leaving it
+        self.to = list()
+        self.capacity = list()
+        self.cost = list()
+
+    def add_node(self):
+        self.arcs_of.append(list())
+        return len(self.arcs_of) - 1
+
+    def add_edge(self, u, v, capacity, cost):
+        arc = len(self.to)
+
+        for tail, head, room, price in [(u, v, capacity, cost), (v, u, 0, -cost)]:
+            self.arcs_of[tail].append(len(self.to))
+            self.to.append(head)
+            self.capacity.append(room)
+            self.cost.append(price)
+
+        return arc
+
+    def flow_on(self, arc):
+        return self.capacity[arc ^ 1]
+
+
+    # Cheapest flow of any size: paths are used while they lower the cost,
+    # so arcs with negative cost act as rewards
+    # RETURN 2-tuple of units of flow and their total cost
+    def solve(self, source, sink):
+        potential = self.initial_potentials(source)
+        flow = total_cost = 0
+
+        while True:
+            distance = self.reduced_distances(source, potential)
+
+            if distance[sink] is None:
+                break
+
+            limit = distance[sink]
+            for node, d in enumerate(distance):
+                potential[node] += limit if d is None else min(d, limit)
+
+            path_cost = potential[sink] - potential[source]
+            if path_cost >= 0:
+                break
+
+            pushed = self.blocking_flow(source, sink, potential)
+            flow += pushed
+            total_cost += pushed * path_cost
+
+        return flow, total_cost
+
+
+    # Bellman-Ford style relaxation, costs may be negative before any flow
+    def initial_potentials(self, source):
+        unreached = float('inf')
+        potential = [unreached] * len(self.arcs_of)
+        potential[source] = 0
+        queue = deque([source])
+        queued = {source}
+
+        while queue:
+            u = queue.popleft()
+            queued.discard(u)
+
+            for arc in self.arcs_of[u]:
+                v = self.to[arc]
+                if self.capacity[arc] > 0 and potential[u] + self.cost[arc] < potential[v]:
+                    potential[v] = potential[u] + self.cost[arc]
+                    if v not in queued:
+                        queued.add(v)
+                        queue.append(v)
+
+        reachable = [P for P in potential if P != unreached]
+        worst = max(reachable, default=0)
+
+        return [worst if P == unreached else P for P in potential]
+
+
+    # Dijkstra on reduced costs, None marks unreachable nodes
+    def reduced_distances(self, source, potential):
+        distance = [None] * len(self.arcs_of)
+        distance[source] = 0
+        heap = [(0, source)]
+        done = [False] * len(self.arcs_of)
+
+        while heap:
+            d, u = heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+
+            for arc in self.arcs_of[u]:
+                if self.capacity[arc] > 0:
+                    v = self.to[arc]
+                    reduced = d + self.cost[arc] + potential[u] - potential[v]
+
+                    if distance[v] is None or reduced < distance[v]:
+                        distance[v] = reduced
+                        heappush(heap, (reduced, v))
+
+        return distance
+
+
+    # Dinic's algorithm restricted to arcs of zero reduced cost
+    # RETURN units pushed from source to sink
+    def blocking_flow(self, source, sink, potential):
+        to, capacity, cost = self.to, self.capacity, self.cost
+
+        def admissible(u, arc):
+            return capacity[arc] > 0 and cost[arc] + potential[u] - potential[to[arc]] == 0
+
+        pushed = 0
+
+        while True:
+            level = [None] * len(self.arcs_of)
+            level[source] = 0
+            queue = deque([source])
+
+            while queue:
+                u = queue.popleft()
+                for arc in self.arcs_of[u]:
+                    v = to[arc]
+                    if level[v] is None and admissible(u, arc):
+                        level[v] = level[u] + 1
+                        queue.append(v)
+
+            if level[sink] is None:
+                return pushed
+
+            next_arc = [0] * len(self.arcs_of)
+
+            # Iterative depth-first search for one path at a time
+            while True:
+                path = list() # arcs from source
+                u = source
+
+                while u != sink:
+                    arcs = self.arcs_of[u]
+
+                    while next_arc[u] < len(arcs):
+                        arc = arcs[next_arc[u]]
+                        v = to[arc]
+                        if level[v] == level[u] + 1 and admissible(u, arc):
+                            break
+                        next_arc[u] += 1
+
+                    if next_arc[u] == len(arcs): # Dead end, retreat
+                        if not path:
+                            break
+                        level[u] = None
+                        arc = path.pop()
+                        u = to[arc ^ 1]
+                        next_arc[u] += 1
+                        continue
+
+                    path.append(arc)
+                    u = v
+
+                if u != sink:
+                    break
+
+                bottleneck = min(capacity[arc] for arc in path)
+                for arc in path:
+                    capacity[arc] -= bottleneck
+                    capacity[arc ^ 1] += bottleneck
+                pushed += bottleneck
@@ -0,0 +1,244 @@
+# GRAPHFILE.PY
+#
+# Compact binary exchange format for bipartite graphs and their matchings,
+# in place of the "u v w" text lines of matcher.save_data_for_solver
+#
+# Layout, all little-endian:
+#   header   magic b'SSGR', version u16, flags u16, vertices i64, edges i64
+#   u        edges x i32
+#   v        edges x i32
+#   w        edges x i64, only when flags has HAS_WEIGHTS
+# A matching is the same file without weights
+#
+# Writing is one buffer write. Reading maps the file and hands out
+# memoryviews of it, so nothing is parsed or copied up front
+#
+# The edge count in the header means a file is only written once every edge
+# is known. Pipes use the stream variant instead, whose length is its end:
+#   header   magic b'SSGS', version u16, flags u16
+#   records  u i32, v i32, w i64 only when flags has HAS_WEIGHTS, until EOF
+# Both ends of a stream hold one chunk of records at a time
+from array import array
+from itertools import islice, starmap
+
+import mmap
+import struct
+import sys
+
+GRAPH_MAGIC = b'SSGR'
+GRAPH_VERSION = 1
+HAS_WEIGHTS = 1
+HEADER = struct.Struct('<4sHHqq')
+VERTEX_CODE = 'i' # 4 bytes on every platform CPython supports
+WEIGHT_CODE = 'q'
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+STREAM_MAGIC = b'SSGS'
+STREAM_HEADER = struct.Struct('<4sHH')
+EDGE_RECORD = struct.Struct('<ii')
+WEIGHTED_RECORD = struct.Struct('<iiq')
+STREAM_CHUNK = 4096 # Records per write
+
+
+class BinaryGraph():
+    """
+    Purely a data object, the arrays of one graph file
+    u, v and w are memoryviews into the file when it could be mapped,
+    close releases the mapping """
+
+    def __init__(self, num_vertices, u, v, w=None, mapping=None):
+        self.num_vertices = num_vertices
+        self.u = u
+        self.v = v
+        self.w = w
+        self.mapping = mapping
+
+    def __len__(self):
+        return len(self.u)
+
+    # Same shape as the edges every solver in this repo takes
+    def edges(self):
+        if self.w is None:
+            return zip(self.u, self.v)
+
+        return zip(self.u, self.v, self.w)
+
+    def close(self):
+        for view in (self.u, self.v, self.w):
+            if isinstance(view, memoryview):
+                view.release()
+
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+        return False
+
+
+def as_array(type_code, values):
+    if isinstance(values, array) and values.typecode == type_code:
+        return values
+
+    return array(type_code, values)
+
+
+# Header and arrays joined into a single buffer
+# RETURN bytes of a graph file, u, v and w may be any integer sequences
+def pack_graph(num_vertices, u, v, w=None):
+    columns = [as_array(VERTEX_CODE, u), as_array(VERTEX_CODE, v)]
+    if w is not None:
+        columns.append(as_array(WEIGHT_CODE, w))
+
+    if len(set(map(len, columns))) > 1:
+        raise ValueError("u, v and w must have the same length")
+
+    if not LITTLE_ENDIAN:
+        columns = [array(C.typecode, C) for C in columns]
+        for C in columns:
+            C.byteswap()
+
+    flags = HAS_WEIGHTS if w is not None else 0
+    header = HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, flags, num_vertices, len(columns[0]))
+
+    return b''.join([header] + [memoryview(C).cast('B') for C in columns])
+
+
+# Write to a path or any binary file-like object, e.g. a solver's stdin
+def write_graph(output, num_vertices, u, v, w=None):
+    data = pack_graph(num_vertices, u, v, w)
+
+    if not hasattr(output, 'write'):
+        with open(output, 'wb') as output_file:
+            output_file.write(data)
+    else:
+        output.write(data)
+
+    return len(data)
+
+
+# Edges as (u, v, w) tuples, see save_data_for_solver
+def write_edges(output, edges, num_vertices):
+    u, v, w = array(VERTEX_CODE), array(VERTEX_CODE), array(WEIGHT_CODE)
+
+    for x, y, weight in edges:
+        u.append(x)
+        v.append(y)
+        w.append(weight)
+
+    return write_graph(output, num_vertices, u, v, w)
+
+
+# Any buffer holding a graph file, e.g. bytes read from a pipe or a mmap
+# RETURN BinaryGraph whose arrays are views into buffer where possible
+def unpack_graph(buffer, mapping=None):
+    columns = list()
+
+    with memoryview(buffer) as view: # Columns outlive it, they are views of buffer
+        if view.nbytes < HEADER.size:
+            raise ValueError("graph file is shorter than its header")
+
+        magic, version, flags, num_vertices, num_edges = HEADER.unpack_from(view)
+
+        if magic != GRAPH_MAGIC or version != GRAPH_VERSION:
+            raise ValueError(f"not a version {GRAPH_VERSION} graph file")
+
+        sizes = [(VERTEX_CODE, 4), (VERTEX_CODE, 4)]
+        if flags & HAS_WEIGHTS:
+            sizes.append((WEIGHT_CODE, 8))
+
+        if view.nbytes != HEADER.size + num_edges * sum(size for code, size in sizes):
+            raise ValueError("graph file size does not match its header")
+
+        offset = HEADER.size
+        data = view.cast('B')
+
+        for type_code, size in sizes:
+            column = data[offset:offset + num_edges * size].cast(type_code)
+
+            if not LITTLE_ENDIAN: # Copy once to swap bytes, views would read them wrong
+                column = array(type_code, column.tobytes())
+                column.byteswap()
+
+            columns.append(column)
+            offset += num_edges * size
+
+    return BinaryGraph(num_vertices, *columns, mapping=mapping)
+
+
+# Map a graph file into memory instead of reading it
+def read_graph(source):
+    with open(source, 'rb') as source_file:
+        mapping = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return unpack_graph(mapping, mapping)
+    except ValueError:
+        mapping.close()
+        raise
+
+
+# Write (u, v) or (u, v, w) rows of any iterable, a generator too, as a stream
+# RETURN number of rows written
+def write_stream(output, rows, weighted=True, chunk=STREAM_CHUNK):
+    record = WEIGHTED_RECORD if weighted else EDGE_RECORD
+    rows = iter(rows)
+    count = 0
+
+    output.write(STREAM_HEADER.pack(STREAM_MAGIC, GRAPH_VERSION, HAS_WEIGHTS if weighted else 0))
+
+    while True:
+        data = b''.join(starmap(record.pack, islice(rows, chunk)))
+        if not data:
+            break
+
+        output.write(data)
+        count += len(data) // record.size
+
+    output.flush()
+
+    return count
+
+
+# Yield the rows of a stream as they arrive, (u, v, w) when it has weights
+def read_stream(source, chunk=STREAM_CHUNK):
+    header = read_exactly(source, STREAM_HEADER.size)
+    if len(header) < STREAM_HEADER.size:
+        raise ValueError("graph stream is shorter than its header")
+
+    magic, version, flags = STREAM_HEADER.unpack(header)
+    if magic != STREAM_MAGIC or version != GRAPH_VERSION:
+        raise ValueError(f"not a version {GRAPH_VERSION} graph stream")
+
+    record = WEIGHTED_RECORD if flags & HAS_WEIGHTS else EDGE_RECORD
+    read = getattr(source, 'read1', source.read) # Whatever the pipe holds, not a full chunk
+    pending = b''
+
+    while True:
+        data = read(chunk * record.size)
+        if not data:
+            break
+
+        pending += data
+        complete = len(pending) - len(pending) % record.size
+        yield from record.iter_unpack(pending[:complete])
+        pending = pending[complete:]
+
+    if pending:
+        raise ValueError("graph stream ends inside a record")
+
+
+def read_exactly(source, size):
+    data = b''
+
+    while len(data) < size:
+        more = source.read(size - len(data))
+        if not more:
+            break
+        data += more
+
+    return data
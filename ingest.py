@@ -0,0 +1,68 @@
+# INGEST.PY
+#
+# Streaming readers for employee availability exports
+# Records are yielded one at a time, so the raw JSON text of a whole roster
+# is never held in memory, only a chunk of it at a time
+#
+# Accepted layouts:
+#   JSON array      [{...}, {...}, ...]
+#   JSON Lines      {...}\n{...}\n...
+import json
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+# Yield availability records from a path or a text file-like object
+def iter_availability(source, chunk_size=CHUNK_SIZE):
+    if not hasattr(source, 'read'):
+        with open(source, 'r') as availability_file:
+            yield from iter_availability(availability_file, chunk_size)
+        return
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    end_of_file = False
+    in_array = None # Unknown until the first character is seen
+
+    while True:
+        # Skip separators: whitespace always, commas only inside an array
+        while position < len(buffer) and (buffer[position] in WHITESPACE
+                or (in_array and buffer[position] == ',')):
+            position += 1
+
+        if position == len(buffer):
+            if end_of_file:
+                break
+
+            buffer = source.read(chunk_size)
+            position = 0
+            end_of_file = len(buffer) == 0
+            continue
+
+        if in_array is None:
+            in_array = buffer[position] == '['
+            position += in_array
+            continue
+
+        if in_array and buffer[position] == ']':
+            return
+
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if end_of_file:
+                raise
+
+            # Record is split across chunks, keep only the unread part
+            more = source.read(chunk_size)
+            end_of_file = len(more) == 0
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+
+        yield record
+
+    if in_array:
+        raise ValueError("Availability array is missing its closing ']'")
@@ -1,34 +1,79 @@
 # Set of utils for logging and debugging
-from inspect import getframeinfo, stack
+# Disabled levels cost one comparison: messages are only formatted,
+# and frames only looked up, when a record is actually emitted
+from collections import OrderedDict
 from pprint import pprint
 
-VERBOSE = True
-DEBUG = True
+import os
+import sys
+import weakref
+
+# Levels, lower is chattier
+LEVEL_DEBUG   = 10
+LEVEL_VERBOSE = 20
+LEVEL_INFO    = 30
+LEVEL_QUIET   = 100
+LEVEL_NAMES   = {
+    'debug': LEVEL_DEBUG,
+    'verbose': LEVEL_VERBOSE,
+    'info': LEVEL_INFO,
+    'quiet': LEVEL_QUIET
+}
+
+# Pick a level with e.g. SHIFT_SCHEDULER_LOG=debug, or call set_level
+LEVEL = LEVEL_NAMES.get(os.environ.get('SHIFT_SCHEDULER_LOG', 'info').lower(), LEVEL_INFO)
+VERBOSE = LEVEL <= LEVEL_VERBOSE
+DEBUG = LEVEL <= LEVEL_DEBUG
 NOT_NOW = -1
 
-MONITOR = dict()
+# track_var keeps at most this many of the latest variables
+MONITOR_LIMIT = 64
+MONITOR = OrderedDict()
+
+
+# A name from LEVEL_NAMES in any case, or one of the LEVEL_ numbers
+def set_level(level):
+    global LEVEL, VERBOSE, DEBUG
+    if not isinstance(level, int):
+        try:
+            level = LEVEL_NAMES[str(level).lower()]
+        except KeyError:
+            raise ValueError(f"no log level named {level!r}, known are {', '.join(LEVEL_NAMES)}")
 
+    LEVEL = level
+    VERBOSE = LEVEL <= LEVEL_VERBOSE
+    DEBUG = LEVEL <= LEVEL_DEBUG
 
 def debuginfo(function_calls_before_now = 1):
-    caller = getframeinfo(stack()[function_calls_before_now][0])
-    return f"{caller.filename}({caller.lineno})"
+    # One frame, not inspect.stack() with source context for all of them
+    caller = sys._getframe(function_calls_before_now)
+    return f"{caller.f_code.co_filename}({caller.f_lineno})"
 
-def log_verbose(verbose_content):
-    global VERBOSE
+def format_message(content, args):
+    """
+    Content may be a %-format with args, or a callable producing the message
+    A callable is given the args, e.g. log_debug(describe, table) """
+    if callable(content):
+        return content(*args)
+    if args:
+        return content % args
+    return content
+
+def log_verbose(verbose_content, *args):
     if VERBOSE:
-        log(verbose_content)
+        log(format_message(verbose_content, args))
 
-def log_debug(debugging_content):
-    global DEBUG
+def log_debug(debugging_content, *args):
     if DEBUG:
-        log(debugging_content)
+        log(format_message(debugging_content, args))
 
 def log_pretty_data(data):
     pprint(data)
 
 def log_value(var_name, value, stack_layer=2):
-    location_id = debuginfo(stack_layer)
-    log_debug(f">>>\t@{location_id}:{var_name} = {value}")
+    if DEBUG:
+        location_id = debuginfo(stack_layer)
+        log(f">>>\t@{location_id}:{var_name} = {value}")
 
 def logg(data, log_level):
     if log_level is NOT_NOW:
@@ -40,16 +85,26 @@ def log(printable_data):
     print(printable_data)
 
 def track_var(var_name, reference):
+    if not DEBUG:
+        return
+
     log_value(var_name, reference, 3)
 
-    global MONITOR
-    MONITOR[var_name] = reference
+    # Weak where possible so monitoring never keeps big objects alive
+    try:
+        entry = weakref.ref(reference)
+    except TypeError:
+        entry = reference
+
+    MONITOR[var_name] = entry
+    MONITOR.move_to_end(var_name)
 
-def inspect_var(var_name):
-    pass
+    while len(MONITOR) > MONITOR_LIMIT:
+        MONITOR.popitem(last=False)
 
 def inspect_var():
-    for var in MONITOR.keys():
-        log_debug(f"<<<\t{var}: {MONITOR[var]}")
+    for var, entry in MONITOR.items():
+        value = entry() if isinstance(entry, weakref.ref) else entry
+        log_debug("<<<\t%s: %s", var, value)
 
     input()
@@ -7,20 +7,51 @@
 # This problem is reduced to Bipartite Graphs & Job Matching,
 # This is done at a "slot" based level. Look into SCHEDULER.PY
 # for more information on time range interpretation of availabilities
-from scheduler import ScheduleInterpreter
-from subprocess import check_output
+from scheduler import ScheduleInterpreter, Slot, SlotTable
+from bipartite import match_by_components
+from bitsets import bits_to_bytes, keys_to_bits
+from solvers import get_backend, registered_name
+from flow import MinCostFlow
+from ingest import iter_availability
+from metrics import RunReport, instrument
+from graphfile import read_graph, write_edges
 from logger import *
 
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import compress, repeat
+from operator import add, attrgetter, floordiv, mod, mul
+import csv
 import json
 
+# Costs per slot for assign_by_hours, coverage always outweighs hours
+COVERAGE_REWARD = 1000
+OVER_TARGET_PENALTY = 10
+
+# Every how many rows sort_rows_by_key samples before filtering by cells
+FILTER_SAMPLE_STRIDE = 64
+
+# Two all-week open positions, copied before use since slots are made in place
+OPEN_POSITION = {
+    # Each time I see this I think about a quick concise generator,
+    # but what if the content changes for only some days? So keep it simple
+    'name': 'Open Position',
+    'M': '10:00-17:00',
+    'T': '10:00-17:00',
+    'W': '10:00-17:00',
+    'R': '10:00-17:00',
+    'F': '10:00-17:00',
+    'S': '10:00-17:00',
+    'U': '10:00-17:00'
+}
+DEFAULT_SHIFT_TEMPLATES = [OPEN_POSITION, OPEN_POSITION]
+
 
 # Using ROW-MAJOR table!!!!
 # That means TABLE[ROW][COLUMN] = cell
 def as_CSV(table):
     lines = []
 
-    log_pretty_data(table)
-
     for each_row in table:
         table_cells_as_strings = list(map(str, each_row))
         lines.append(",".join(table_cells_as_strings))
@@ -28,99 +59,423 @@ def as_CSV(table):
     return ("\n".join(lines))
 
 
+# Stream rows of a ROW-MAJOR table to a path or any file-like object
+# Rows may come from a generator, e.g. ScheduleInterpreter.iter_schedule,
+# so nothing but the current row is held. Cells read the same as in as_CSV
+# RETURN number of rows written
+def write_CSV(rows, output):
+    if not hasattr(output, 'write'):
+        with open(output, 'w', newline='') as output_file:
+            return write_CSV(rows, output_file)
+
+    writer = csv.writer(output, lineterminator='\n')
+    count = 0
+
+    for each_row in rows:
+        writer.writerow(map(str, each_row))
+        count += 1
+
+    return count
+
+
 # Take two sets of all unique slots that can be matched
 # By an equality of Time of Day stored in the UID of each slot
 # The method reduces the problem to Job Matching in Graph Theory
 # by treating each set of slots as partitions in a bipartite graph
 # RETURNS a set of 2-tuples that represent the assignment of an
 #   employee to a INTERVAL-sized shift, aka slot.
-def assign_shifts(w_slots, s_slots):
-    slots = sorted(w_slots + s_slots)
-    vertices = range(len(slots))
-    edges = select_matching_pairs(w_slots, s_slots) # Edges describe bipartite graph
+# A list passed as report collects how each graph component was solved,
+# a RunReport also times each stage, see METRICS.PY
+# Slot lists made at another SHIFT_LENGTH pass it as interval
+def assign_shifts(w_slots, s_slots, report=None, backend=None,
+                  interval=ScheduleInterpreter.SHIFT_LENGTH):
+    if isinstance(w_slots, SlotTable):
+        return assign_table_rows(w_slots, s_slots, report, backend, interval)
+
+    run = instrument(report)
+    run.count('worker_slots', len(w_slots))
+    run.count('shift_slots', len(s_slots))
+
+    with run.stage('select_matching_pairs'):
+        slots = sorted(w_slots + s_slots, key=attrgetter("key"))
+        vertices = range(len(slots))
+        edges = select_matching_pairs(w_slots, s_slots, interval) # Edges describe bipartite graph
 
     vertex_2_slot = dict(zip(vertices, slots))
     slot_2_vertex = dict(zip(slots, vertices))
 
     edges = [(slot_2_vertex.get(w), slot_2_vertex.get(s), w.weight)
                 for w, s in edges]
+    run.count('edges', len(edges))
 
-    # Solve Job Matching problem
-    def decide_matching(edges, vertices):
-        path2file = "./docs/xuMakerSpringAvailability"
-
-        save_data_for_solver(edges, len(vertices), path2file)
-        solver_args = ['./match_bipartite_graph', '-f', path2file, '--max']
-        solver_output = check_output(solver_args).decode("utf-8").split('\n')
-        edge_set = parse_graph_solution(solver_output)
-
-        return edge_set
+    with run.stage('solve'):
+        edges = decide_matching(edges, report, backend)
 
-    edges = decide_matching(edges, vertices)
+    run.count('matched', len(edges))
     assigned_shifts = [(vertex_2_slot.get(w), vertex_2_slot.get(s))
                 for w, s in edges]
 
     return(assigned_shifts)
 
 
+# Solve Job Matching problem in-process, one connected component at a time,
+# or with any backend from SOLVERS.PY, given as an object or by name
+# A time_limit in seconds needs a backend that supports one, e.g. 'anytime'
+# A list passed as report collects a ComponentReport per component
+# RETURN list of (u, v) matched vertex pairs
+def decide_matching(edges, report=None, backend=None, time_limit=None):
+    if backend is None and time_limit is None:
+        return match_by_components(edges, maximize_weight=True, report=report)
+
+    backend = get_backend(backend or 'anytime')
+
+    if time_limit is not None and not backend.supports(time_limit=True):
+        raise ValueError(f"{backend.name} solver backend takes no time limit")
+
+    return backend.solve(edges, report, time_limit)
+
+
+# Same contract as assign_shifts for two SlotTables
+# Rows are vertices as-is: worker row w is vertex w, shift row s is
+# vertex len(w_table) + s. Only matched rows are turned into Slots
+def assign_table_rows(w_table, s_table, report=None, backend=None,
+                      interval=ScheduleInterpreter.SHIFT_LENGTH):
+    run = instrument(report)
+    run.count('worker_slots', len(w_table))
+    run.count('shift_slots', len(s_table))
+
+    first_shift = len(w_table)
+
+    with run.stage('select_matching_pairs'):
+        u, v, weights = merge_matching_rows(w_table, s_table, first_shift, interval)
+
+    run.count('edges', len(u))
+
+    with run.stage('solve'):
+        edges = decide_matching(zip(u, v, weights), report, backend)
+
+    run.count('matched', len(edges))
+    assigned_shifts = [(w_table[w], s_table[s - first_shift]) for w, s in edges]
+
+    return(assigned_shifts)
+
+
+# Same contract as assign_shifts for two SlotTables, also honoring the hours
+# each employee asked for (SlotTable.hours) in one min-cost flow solve:
+#   source -> employee -> worker slot -> shift slot -> sink
+# Every covered slot earns COVERAGE_REWARD, so coverage is still maximal.
+# Each employee's arc from the source follows a convex cost curve, free up
+# to their desired hours, then OVER_TARGET_PENALTY per slot, doubled past
+# twice their desired hours. Employees without hours have no curve
+def assign_by_hours(w_table, s_table, interval=ScheduleInterpreter.SHIFT_LENGTH, report=None):
+    run = instrument(report)
+    run.count('worker_slots', len(w_table))
+    run.count('shift_slots', len(s_table))
+
+    with run.stage('select_matching_pairs'):
+        w_rows, s_rows = select_matching_rows(w_table, s_table)
+
+    run.count('edges', len(w_rows))
+    network = MinCostFlow()
+    source = network.add_node()
+    sink = network.add_node()
+    unlimited = len(s_table)
+    employee_node = dict()
+    worker_node = dict()
+    shift_node = dict()
+    pair_arcs = list()
+
+    for w, s in zip(w_rows, s_rows):
+        owner = w_table.owner[w]
+
+        if owner not in employee_node:
+            employee_node[owner] = network.add_node()
+            hours = w_table.hours.get(owner)
+
+            if hours is None:
+                network.add_edge(source, employee_node[owner], unlimited, 0)
+            else:
+                target = int(hours * 60) // interval
+                network.add_edge(source, employee_node[owner], target, 0)
+                network.add_edge(source, employee_node[owner], target, OVER_TARGET_PENALTY)
+                network.add_edge(source, employee_node[owner], unlimited, 2 * OVER_TARGET_PENALTY)
+
+        if w not in worker_node:
+            worker_node[w] = network.add_node()
+            network.add_edge(employee_node[owner], worker_node[w], 1, 0)
+
+        if s not in shift_node:
+            shift_node[s] = network.add_node()
+            network.add_edge(shift_node[s], sink, 1, 0)
+
+        cost = -(COVERAGE_REWARD + w_table.weight[w])
+        pair_arcs.append((network.add_edge(worker_node[w], shift_node[s], 1, cost), w, s))
+
+    run.count('vertices', len(worker_node) + len(shift_node)) # Slots with an edge, as in components
+
+    with run.stage('solve'):
+        network.solve(source, sink)
+
+    assigned_shifts = [(w_table[w], s_table[s]) for arc, w, s in pair_arcs
+                        if network.flow_on(arc)]
+    run.count('matched', len(assigned_shifts))
+
+    return(assigned_shifts)
+
+
+# Same contract as assign_shifts, but workers arrive as a stream of raw records
+# Each record is sanitized, expanded, keyed and joined against the shift table
+# as it is read, and the resulting edges go straight into the solver's graph.
+# Only worker slots that meet an open shift are kept, as rows of a SlotTable
+# Reading the stream happens inside the solver's graph building, so its
+# time is part of the solve stage
+# Given an empty SlotTable as w_table, the caller keeps those rows along with
+# every worker's name and desired hours, matched or not
+def stream_assign_shifts(scheduler, records, s_table, report=None, backend=None, w_table=None):
+    run = instrument(report)
+    worker_type = ScheduleInterpreter.TYPE_WORKER
+    w_table = SlotTable() if w_table is None else w_table
+    first_worker = len(s_table) # Shift rows are vertices 0 to len(s_table) - 1
+    join_zone = dict()
+    num_edges = 0
+
+    for row, key in enumerate(s_table.key):
+        join_zone.setdefault(key, []).append(row)
+
+    def edges():
+        nonlocal num_edges
+
+        for ID, availability in enumerate(records):
+            availability["id"] = ID
+            availability["type"] = worker_type
+            scheduler.sanitize_availability(availability)
+            w_table.add_owner(ID, availability.get("name", None),
+                              scheduler.desired_hours(availability))
+
+            for day_in_cycle, TOD in scheduler.iter_slot_times(availability):
+                shift_rows = join_zone.get(day_in_cycle * Slot.MINUTES_PER_DAY + TOD)
+
+                if shift_rows:
+                    vertex = first_worker + len(w_table)
+                    w_table.add_slot(day_in_cycle, ID, TOD, worker_type)
+                    num_edges += len(shift_rows)
+
+                    for each_row in shift_rows:
+                        yield (vertex, each_row, 0)
+
+    with run.stage('solve'):
+        edges = decide_matching(edges(), report, backend)
+
+    run.count('edges', num_edges)
+    run.count('worker_slots', len(w_table))
+    run.count('shift_slots', len(s_table))
+    run.count('matched', len(edges))
+    assigned_shifts = [(w_table[w - first_worker], s_table[s]) for w, s in edges]
+
+    return(assigned_shifts)
+
+
+# Same contract as assign_shifts, but vertices are interval pieces
+# Availability and coverage are cut into elementary segments on each day,
+# i.e. spans where the set of available workers and open shifts is constant.
+# Every slot in a segment has the same bipartite graph, so one matching
+# per segment covers all of its slots at once
+# That graph is complete and no piece is in two segments, so there is nothing
+# to search: a maximum matching of a segment pairs its min(|W|, |S|) heaviest
+# worker pieces with its shift pieces, the most weight any can have. No edge is
+# built and no backend is needed, one is taken for the assign_shifts contract
+# RETURNS a list of 2-tuples of Intervals clipped to their segment,
+#   make_schedule writes them cell by cell without expanding them
+def assign_intervals(w_intervals, s_intervals, report=None, backend=None):
+    run = instrument(report)
+    assigned_shifts = list()
+    get_weight = attrgetter("weight")
+
+    with run.stage('split_into_segments'):
+        segments = split_into_segments(w_intervals, s_intervals)
+
+    with run.stage('solve'):
+        for w_segment, s_segment in segments:
+            if len(w_segment) > len(s_segment): # Stable, ties go to the first listed
+                w_segment = sorted(w_segment, key=get_weight, reverse=True)
+
+            assigned_shifts += zip(w_segment, s_segment)
+
+    run.count('segments', len(segments))
+    run.count('edges', sum(len(W) * len(S) for W, S in segments)) # As a graph would have
+    run.count('matched', len(assigned_shifts))
+
+    return(assigned_shifts)
+
+
 # The I/O high-level director of this program sourcing data and writing it back
-def make_matching(availability_file):
-    file = open(availability_file, 'r')
-    worker_availability = json.loads(file.read())
-    file.close()
-
-    position1_shifts = position2_shifts = {
-        # Each time I see this I think about a quick concise generator,
-        # but what if the content changes for only some days? So keep it simple
-        'name': 'Open Position',
-        'M': '10:00-17:00',
-        'T': '10:00-17:00',
-        'W': '10:00-17:00',
-        'R': '10:00-17:00',
-        'F': '10:00-17:00',
-        'S': '10:00-17:00',
-        'U': '10:00-17:00'
-    }
+# With streaming on, the file may be a JSON array or JSON Lines and is read
+# record by record, see stream_assign_shifts. Rows then go to the CSV as they
+# are built and no table is held: the number of rows written is returned
+# Shift templates default to two all-week open positions and are copied,
+# so the caller's dicts are never modified
+# Given a ScheduleCache, identical inputs are answered from disk; streaming
+# runs never hold the whole input, so they are not cached. Neither are runs
+# on a backend that is not registered, nothing names what solved them
+# With honor_hours on, desired hours shape the assignment, see assign_by_hours
+# A RunReport passed as report is filled with stage times and counts,
+# given a metrics_file it is also written there in Prometheus text format
+# A solver backend, see SOLVERS.PY, may replace the in-process matching;
+# desired hours always need the min-cost flow, see check_matching_options
+# A ScheduleAnalytics passed as analytics is filled from the same assignments,
+# see ANALYTICS.PY. Such runs skip the cache, a cached table has no assignments
+def make_matching(availability_file, by_interval=False, output='new_schedule.csv',
+        streaming=False, shift_templates=None, cache=None, honor_hours=False,
+        report=None, metrics_file=None, backend=None, analytics=None):
+    check_matching_options(streaming, by_interval, honor_hours, backend)
+
+    if report is None:
+        report = list() if metrics_file is None else RunReport()
+
+    run = instrument(report)
+
+    if streaming:
+        worker_availability = iter_availability(availability_file)
+    else:
+        with run.stage('parse'):
+            file = open(availability_file, 'r')
+            worker_availability = json.loads(file.read())
+            file.close()
+
+    if shift_templates is None:
+        shift_templates = DEFAULT_SHIFT_TEMPLATES
+
+    shift_templates = [dict(T) for T in shift_templates]
 
     # Convert given schedules into UIDs to be matched by shared time
     scheduler = ScheduleInterpreter()
     workers = ScheduleInterpreter.TYPE_WORKER
     shifts  = ScheduleInterpreter.TYPE_SHIFT
-    w_slots = scheduler.make_slots(workers, *worker_availability)
-    s_slots = scheduler.make_slots(shifts, position1_shifts, position2_shifts)
+    cache_key = None
+    cacheable = backend is None or registered_name(backend) is not None
+
+    if cache is not None and not streaming and analytics is None and cacheable:
+        with run.stage('cache'):
+            cache_key = cache.key_for(
+                [scheduler.sanitize_availability(dict(A, id=ID, type=workers))
+                    for ID, A in enumerate(worker_availability)],
+                [scheduler.sanitize_availability(dict(T, id=ID, type=shifts))
+                    for ID, T in enumerate(shift_templates)],
+                {
+                    'SHIFT_LENGTH': scheduler.SHIFT_LENGTH,
+                    'FIRST_SHIFT': scheduler.FIRST_SHIFT,
+                    'LAST_SHIFT': scheduler.LAST_SHIFT,
+                    'weight_policy': [scheduler.LONG_SHIFT],
+                    'by_interval': by_interval,
+                    'honor_hours': honor_hours,
+                    'backend': registered_name(backend)
+                })
+            table = cache.get(cache_key)
+
+        if table is not None:
+            run.count('cache_hits')
+            with run.stage('write_CSV'):
+                write_CSV(table, output)
+            finish_report(report, metrics_file)
+            return(table)
+
+    if streaming:
+        with run.stage('make_slots'):
+            w_slots = SlotTable() # Filled as the stream is read
+            s_slots = scheduler.make_slot_table(shifts, *shift_templates)
+        assignments = stream_assign_shifts(scheduler, worker_availability, s_slots, report, backend,
+                                           w_slots)
+
+    elif by_interval:
+        with run.stage('make_slots'):
+            w_intervals = scheduler.make_intervals(workers, *worker_availability)
+            s_intervals = scheduler.make_intervals(shifts, *shift_templates)
+        assignments = assign_intervals(w_intervals, s_intervals, report, backend)
+
+    else:
+        with run.stage('make_slots'):
+            w_slots = scheduler.make_slot_table(workers, *worker_availability)
+            s_slots = scheduler.make_slot_table(shifts, *shift_templates)
+
+        if honor_hours:
+            assignments = assign_by_hours(w_slots, s_slots, scheduler.SHIFT_LENGTH, report)
+        else:
+            # TODO: Find the bug that causes an empty line to be in output
+            assignments = assign_shifts(w_slots, s_slots, report, backend)
+
+    if analytics is not None:
+        with run.stage('analytics'):
+            if by_interval:
+                analytics.add(assignments, s_intervals,
+                              {A["id"]: scheduler.desired_hours(A) for A in worker_availability},
+                              {A["id"]: A.get("name") for A in worker_availability})
+            else:
+                analytics.add(assignments, s_slots,
+                              {ID: w_slots.hours.get(ID) for ID in w_slots.names}, w_slots.names)
+
+    log_verbose(lambda: (f"Solved {len(report)} components, largest has "
+        f"{max([C.vertices for C in report], default=0)} vertices, "
+        f"{sum(C.seconds for C in report) * 1000:.1f}ms in total"))
+
+    if streaming:
+        with run.stage('write_CSV'):
+            written = write_CSV(scheduler.iter_schedule(assignments), output)
+        finish_report(report, metrics_file)
+        return(written)
+
+    with run.stage('make_schedule'):
+        table = scheduler.make_schedule(assignments)
+
+    with run.stage('write_CSV'):
+        write_CSV(table, output)
+
+    if cache_key is not None:
+        with run.stage('cache'):
+            cache.put(cache_key, table)
+
+    finish_report(report, metrics_file)
 
-    # TODO: Find the bug that causes an empty line to be in output
-    assignments = assign_shifts(w_slots, s_slots)
-    table = scheduler.make_schedule(assignments)
+    return(table)
 
-    output_file = open('new_schedule.csv', 'w')
-    output_file.write(as_CSV(table))
-    output_file.close()
 
-    return(table)
+# Desired hours are only honored by the min-cost flow over whole slot tables,
+# so honor_hours can not be combined with a stream, intervals or a backend
+def check_matching_options(streaming=False, by_interval=False, honor_hours=False, backend=None):
+    if not honor_hours:
+        return
+
+    conflicts = [name for name, value in (('streaming', streaming), ('by_interval', by_interval),
+                                          ('backend', backend is not None)) if value]
+    if conflicts:
+        raise ValueError(f"honor_hours can not be combined with {', '.join(conflicts)}")
+
+
+# Log a RunReport at verbose level and export it if asked to
+def finish_report(report, metrics_file):
+    if not isinstance(report, RunReport):
+        return
+
+    log_verbose(lambda: f"Run report: {report}")
+
+    if metrics_file is not None:
+        report.write_prometheus(metrics_file)
 
 
 # Given two collections and a proceedure to retrieve key
 # Make pairs of all matches using psuedo hash-join on equality
 # Returns list of 2-tuples
 def match_equal_key_pairs(left, right, get_key):
-    left_keys = list(map(get_key, left))
-    right_keys = list(map(get_key, right))
-
-    list_of_lists = [[] for W in range(len(left_keys))]
-    join_zone = dict(zip(left_keys, list_of_lists))
+    join_zone = dict()
     matched_pairs = list()
 
-    # Create buckets indexed by left list keys
-    for W in range(len(left)):
-        join_zone[left_keys[W]].append(left[W])
-
-    for W in range(len(right)):
-        right_key = right_keys[W]
+    # Create buckets indexed by left list keys, one list per distinct key
+    for each_item in left:
+        join_zone.setdefault(get_key(each_item), []).append(each_item)
 
+    for right_item in right:
         # Match all right list items with all previously bucketed items
-        for each_item in join_zone.get(right_key, list()):
-            matched_pairs.append( (each_item, right[W]) )
+        for each_item in join_zone.get(get_key(right_item), ()):
+            matched_pairs.append( (each_item, right_item) )
 
     return matched_pairs
 
@@ -198,11 +553,153 @@ def save_data_for_solver(edges, num_vertices, output_file_name):
     output_file.close()
 
 
+# Binary counterpart of save_data_for_solver, see GRAPHFILE.PY
+def save_graph_for_solver(edges, num_vertices, output_file_name):
+    return write_edges(output_file_name, edges, num_vertices)
+
+
+# Binary counterpart of parse_graph_solution, the solver answers with a
+# graph file of matched pairs and no weights
+# RETURN matched edges as list of 2-tuples
+def read_graph_solution(solution_file_name):
+    with read_graph(solution_file_name) as matching:
+        return list(matching.edges())
+
+
+# Hash-join of two SlotTables on their packed keys
+# RETURN two parallel arrays of matched worker rows and shift rows
+def select_matching_rows(w_table, s_table):
+    join_zone = dict()
+    w_rows = array('l')
+    s_rows = array('l')
+
+    for row, key in enumerate(s_table.key):
+        join_zone.setdefault(key, []).append(row)
+
+    for row, key in enumerate(w_table.key):
+        for each_row in join_zone.get(key, ()):
+            w_rows.append(row)
+            s_rows.append(each_row)
+
+    return w_rows, s_rows
+
+
+# Sort-merge join of two SlotTables on their packed keys
+# Like select_matching_pairs, the larger table is first cut down to the
+# cells the smaller one has at all, so only rows that can pair are sorted
+# Worker rows sharing a key meet every shift row of that key, so each key
+# is emitted as whole runs with array.extend, no work is done per edge
+# interval is the SHIFT_LENGTH the tables were made with, see select_matching_pairs
+# RETURN three parallel arrays: worker rows, shift rows plus shift_offset,
+#   and the weight of each worker row, i.e. (u, v, weight) columns
+def merge_matching_rows(w_table, s_table, shift_offset=0,
+                        interval=ScheduleInterpreter.SHIFT_LENGTH):
+    if len(s_table) <= len(w_table):
+        w_keys, w_order = sort_rows_by_key(w_table, keys_to_bits(s_table.key, interval), interval)
+        s_keys, s_order = sort_rows_by_key(s_table)
+    else:
+        w_keys, w_order = sort_rows_by_key(w_table)
+        s_keys, s_order = sort_rows_by_key(s_table, keys_to_bits(w_table.key, interval), interval)
+
+    w_weights = array('l', map(w_table.weight.__getitem__, w_order))
+
+    u, v, weights = array('l'), array('l'), array('l')
+    w, s = 0, 0
+
+    while w < len(w_keys) and s < len(s_keys):
+        if w_keys[w] < s_keys[s]:
+            w = bisect_left(w_keys, s_keys[s], w)
+        elif s_keys[s] < w_keys[w]:
+            s = bisect_left(s_keys, w_keys[w], s)
+        else:
+            w_end = bisect_right(w_keys, w_keys[w], w)
+            s_end = bisect_right(s_keys, s_keys[s], s)
+            workers, their_weights = w_order[w:w_end], w_weights[w:w_end]
+
+            for shift_row in s_order[s:s_end]:
+                u.extend(workers)
+                v.extend(array('l', [shift_offset + shift_row]) * (w_end - w))
+                weights.extend(their_weights)
+
+            w, s = w_end, s_end
+
+    return u, v, weights
+
+
+# Rows packed behind their key into one integer each, so sorting and
+# unpacking run over plain ints without a Python key function
+# Given cells, a bitset as keys_to_bits makes, rows outside them are left out.
+# Filtering costs about a fifth of the sort it shortens, so when a sample of
+# rows says most are inside anyway, every row is sorted as it is
+# RETURN two arrays, the sorted keys and the rows in that order
+def sort_rows_by_key(table, cells=None, interval=ScheduleInterpreter.SHIFT_LENGTH):
+    rows = len(table)
+    packed = map(add, map(mul, table.key, repeat(rows)), range(rows))
+
+    if cells is not None:
+        inside = bits_to_bytes(cells, max(table.key, default=0) // interval + 1)
+        sample = table.key[::FILTER_SAMPLE_STRIDE]
+
+        if sum(map(inside.__getitem__, map(floordiv, sample, repeat(interval)))) < 0.75 * len(sample):
+            packed = compress(packed, map(inside.__getitem__,
+                                          map(floordiv, table.key, repeat(interval))))
+
+    packed = sorted(packed)
+
+    return (array('l', map(floordiv, packed, repeat(rows))),
+            array('l', map(mod, packed, repeat(rows))))
+
+
+# Cut intervals of both kinds at every start and end on their day
+# Segments without an open shift or without a worker are dropped
+# RETURN list of 2-tuples (worker pieces, shift pieces), one per segment
+def split_into_segments(w_intervals, s_intervals):
+    days = dict()
+
+    for side, intervals in enumerate([w_intervals, s_intervals]):
+        for I in intervals:
+            days.setdefault(I.day_in_cycle, ([], []))[side].append(I)
+
+    segments = list()
+
+    for day in sorted(days.keys()):
+        by_side = days[day]
+        cuts = sorted(set(T for I in by_side[0] + by_side[1] for T in (I.start, I.end)))
+        covering = [([], []) for cut in cuts]
+
+        for side in range(len(by_side)):
+            for I in by_side[side]:
+                for c in range(bisect_left(cuts, I.start), bisect_left(cuts, I.end)):
+                    covering[c][side].append(I)
+
+        for c in range(len(cuts) - 1):
+            workers, shifts = covering[c]
+
+            if workers and shifts:
+                start, end = cuts[c], cuts[c + 1]
+                segments.append((
+                    [W.clip(start, end) for W in workers],
+                    [S.clip(start, end) for S in shifts]
+                ))
+
+    return segments
+
+
 # High-level readable function to join two sets of UIDs
+# The larger side is first cut down to the cells the smaller side has at all,
+# one bit test per slot, so slots nobody can pair with are never bucketed
+# interval is the SHIFT_LENGTH the slots were made with. Any interval is
+# correct, equal keys share a cell, but one coarser than the slots filters less
 # RETURN matched UIDs as 2-tuples
-def select_matching_pairs(worker_slots, shift_slots):
-    def get_key_from_a_slot(slot):
-        return int(slot)
+def select_matching_pairs(worker_slots, shift_slots, interval=ScheduleInterpreter.SHIFT_LENGTH):
+    get_key_from_a_slot = attrgetter("key")
+
+    if len(shift_slots) <= len(worker_slots):
+        cells = keys_to_bits(map(get_key_from_a_slot, shift_slots), interval)
+        worker_slots = [W for W in worker_slots if cells >> W.key // interval & 1]
+    else:
+        cells = keys_to_bits(map(get_key_from_a_slot, worker_slots), interval)
+        shift_slots = [S for S in shift_slots if cells >> S.key // interval & 1]
 
     return match_equal_key_pairs(worker_slots, shift_slots, get_key_from_a_slot)
 
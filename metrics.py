@@ -0,0 +1,123 @@
+# METRICS.PY
+#
+# Stage timers and counters for one run of the scheduler, so a slow run
+# shows where its time went: parsing, slot expansion, the hash-join,
+# the solver or building the table
+#
+# Pass a RunReport as report to make_matching or any assign_* function.
+# It collects ComponentReports just like the plain lists they also accept.
+# Without one, instrumented code talks to NO_REPORT, whose methods do nothing
+from time import perf_counter
+
+import os
+
+
+class StageTimer():
+    """ Context manager adding its wall time to one stage of a RunReport """
+    __slots__ = ('report', 'name', 'start')
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        stages = self.report.stages
+        stages[self.name] = stages.get(self.name, 0.0) + perf_counter() - self.start
+        return False
+
+
+class RunReport():
+    """
+    Seconds per stage and counts of slots, edges, vertices and matched pairs
+    vertices are the slots with at least one edge, on every solving path
+    Stages and counters keep the order they were first seen in """
+
+    def __init__(self):
+        self.stages = dict()   # name -> seconds, repeated stages add up
+        self.counters = dict() # name -> total
+        self.components = list()
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Same use as list.append, for match_by_components
+    def append(self, component_report):
+        self.components.append(component_report)
+        self.count('components')
+        self.count('vertices', component_report.vertices)
+
+        if hasattr(component_report, 'upper_bound'): # An approximate solve
+            self.count('upper_bound', component_report.upper_bound)
+
+    def __iter__(self):
+        return iter(self.components)
+
+    def __len__(self):
+        return len(self.components)
+
+    def as_dict(self):
+        return {'stages': dict(self.stages), 'counters': dict(self.counters)}
+
+    # Prometheus text exposition format, every value as a gauge of this run
+    def as_prometheus(self, prefix='shift_scheduler'):
+        lines = [f"# TYPE {prefix}_stage_seconds gauge"]
+        lines += [f'{prefix}_stage_seconds{{stage="{name}"}} {seconds:.6f}'
+                    for name, seconds in self.stages.items()]
+
+        for name, total in self.counters.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {total}")
+
+        return "\n".join(lines) + "\n"
+
+    # Write then rename, so a collector never scrapes half a file
+    def write_prometheus(self, path, prefix='shift_scheduler'):
+        partial = f"{path}.{os.getpid()}.tmp"
+
+        with open(partial, 'w') as metrics_file:
+            metrics_file.write(self.as_prometheus(prefix))
+        os.replace(partial, path)
+
+    def __repr__(self):
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+        counters = ", ".join(f"{name} {total}" for name, total in self.counters.items())
+        return f"{stages}; {counters}"
+
+
+class NullTimer():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+class NullReport():
+    """ Stands in for a RunReport when nobody asked for one """
+    __slots__ = ()
+    TIMER = NullTimer()
+
+    def stage(self, name):
+        return self.TIMER
+
+    def count(self, name, amount=1):
+        pass
+
+    def append(self, component_report):
+        pass
+
+NO_REPORT = NullReport()
+
+
+# RETURN report if it can time stages, otherwise NO_REPORT
+# Plain lists still collect ComponentReports where they are passed on
+def instrument(report):
+    return report if isinstance(report, RunReport) else NO_REPORT
@@ -16,6 +16,16 @@
 # and each worker has a reasonable shift
 from logger import *
 
+from array import array
+from functools import lru_cache
+from itertools import chain, repeat
+from operator import add
+
+import re
+
+# hh, hh:mm, each optionally followed by am/pm, spaces allowed anywhere
+TIME_FORMAT = re.compile(r" *(\d+) *(?:: *(\d+))? *([aApP][mM])? *")
+
 
 class ScheduleInterpreter():
     SHIFT_LENGTH = 15
@@ -28,6 +38,9 @@ class ScheduleInterpreter():
     # Flags for weighting slots
     LONG_SHIFT   = 1
 
+    # Distinct time strings remembered by the parsers
+    TIME_CACHE_SIZE = 1024
+
     def __init__(self, start=FIRST_SHIFT, end=LAST_SHIFT, shift_len=SHIFT_LENGTH):
         """ Keeping some design choices constant for compatibility, i.e. minimal breaking changes """
         self.FIRST_SHIFT = start
@@ -76,6 +89,15 @@ class ScheduleInterpreter():
         return avail
 
 
+    @staticmethod
+    def desired_hours(avail):
+        """ Hours a sanitized availability asks for, None if missing or unreadable """
+        try:
+            return float(avail["hours"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
     def convert_availability_to_slots(self, avail, weight_policy=None):
         self.sanitize_availability(avail)
 
@@ -90,7 +112,7 @@ class ScheduleInterpreter():
             try: # filter by integer keys
                 day_in_cycle = int(key)
             except ValueError as e:
-                log_debug(f"Key in times_by_day is not integer: {key}")
+                log_debug("Key in times_by_day is not integer: %s", key)
                 continue
 
             for TOD in times_by_day[key]:
@@ -103,14 +125,47 @@ class ScheduleInterpreter():
     # TODO: simplify by forcing military time
     def create_TOD_slot_range(self, start_inclusive, end_exclusive, military_time=False):
         """ Given 13:00 and 16:50, return 13*60, 13*60 +15, ..., 16:30 """
+        start_in_minutes, end_in_minutes = \
+            self.create_TOD_minute_range(start_inclusive, end_exclusive, military_time)
+
+        return(list(range(start_in_minutes, end_in_minutes, self.SHIFT_LENGTH)))
+
+
+    def create_TOD_minute_range(self, start_inclusive, end_exclusive, military_time=False):
+        """ Given 13:00 and 16:50, return (13*60, 16*60 + 45) rounded to SHIFT_LENGTH """
+        return self.minute_range_of(start_inclusive, end_exclusive, military_time,
+                                    self.FIRST_SHIFT, self.SHIFT_LENGTH)
+
+
+    def parse_time_range(self, timerange):
+        """ Given "1pm-5pm", return (13*60, 17*60), see create_TOD_minute_range """
+        return self.time_range_of(timerange, self.FIRST_SHIFT, self.SHIFT_LENGTH)
+
+
+    # Settings are part of the arguments so the caches are shared safely
+    # between interpreters with different FIRST_SHIFT or SHIFT_LENGTH
+    @staticmethod
+    @lru_cache(maxsize=TIME_CACHE_SIZE)
+    def time_range_of(timerange, first_shift, interval):
+        assert("-" in timerange)
+
+        start, end = timerange.split("-")
+        military_time_on = False
+
+        return ScheduleInterpreter.minute_range_of(
+            start, end, military_time_on, first_shift, interval)
+
+
+    @staticmethod
+    @lru_cache(maxsize=TIME_CACHE_SIZE)
+    def minute_range_of(start_inclusive, end_exclusive, military_time, first_shift, interval):
         # TODO: Debate "duplication of code" versus readability
 
-        interval = self.SHIFT_LENGTH
-        starting_minute = self.text_to_minutes(start_inclusive)
-        ending_minute = self.text_to_minutes(end_exclusive)
+        starting_minute = ScheduleInterpreter.text_to_minutes(start_inclusive)
+        ending_minute = ScheduleInterpreter.text_to_minutes(end_exclusive)
 
         if not military_time \
-            and (starting_minute < self.text_to_minutes(self.FIRST_SHIFT)):
+            and (starting_minute < ScheduleInterpreter.text_to_minutes(first_shift)):
             # Must be PM work if earlier than first shift
             starting_minute += (12 * 60)
 
@@ -120,50 +175,60 @@ class ScheduleInterpreter():
             # this is a workaround to insure 24-hour upheld
             ending_minute += (12 * 60)
 
-        start_in_minutes = self.round_off(starting_minute, interval)
-        end_in_minutes = self.round_off(ending_minute, interval)
+        start_in_minutes = ScheduleInterpreter.round_off(starting_minute, interval)
+        end_in_minutes = ScheduleInterpreter.round_off(ending_minute, interval)
 
-        return(list(range(start_in_minutes, end_in_minutes, interval)))
+        return (start_in_minutes, end_in_minutes)
 
 
     def make_schedule(self, assignments):
-        worker_slot = 0
-        shift_slot = 1
-
-        shifts = [A[shift_slot] for A in assignments]
-        cells = list()
-
-        def to_col(slot):
-            return (slot.day_in_cycle, slot.ID)
-        columns = sorted(list(set(map(to_col, shifts))))
-
-        def to_row(slot):
-            return (slot.time_of_day)
-        rows = sorted(list(set(map(to_row, shifts))))
-
-        for shift in assignments:
-            W = shift[worker_slot]
-            S = shift[shift_slot]
-            C = Cell(
-                row=(rows.index(to_row(S))),
-                col=(columns.index(to_col(S))),
-                value=W
-            )
-            cells.append(C)
-
-        schedule_table = self.make_table(cells)
-
-        # Use following loop to Add Time of Dat Column to Left Side of table
-        assert(len(rows) == len(schedule_table))
-        for row_index in range(len(rows)):
-            time_of_day = rows[row_index]
-            schedule_table[row_index].insert(0, time_of_day)
+        return list(self.iter_schedule(assignments))
+
+
+    def iter_schedule(self, assignments):
+        """
+        Same rows as make_schedule, yielded one at a time: headers, then each time of day
+        Intervals are never expanded. Assignments are bucketed by start and each row
+        is built from those still covering its time of day, so one row of cells is held """
+        interval = self.SHIFT_LENGTH
+        columns = set()
+        starting = dict() # time of day -> assignments starting then, references only
+
+        def span_of(slot):
+            if isinstance(slot, Interval):
+                return slot.start, slot.end
+            return slot.time_of_day, slot.time_of_day + interval
+
+        for A in assignments:
+            S = A[1]
+            columns.add((S.day_in_cycle, S.ID))
+            starting.setdefault(span_of(S)[0], []).append(A)
+
+        columns = sorted(columns)
+        column_of = {column: index for index, column in enumerate(columns)}
+        times = sorted(set(chain.from_iterable(
+            range(start, max(span_of(S)[1] for W, S in starting[start]), interval)
+                for start in starting)))
+        active = list() # (end, column, worker) of assignments covering this time
 
         # Add headers to table
-        headers = [["Time of Day"] + [C[0] for C in columns]]
-        schedule = headers + schedule_table
+        yield ["Time of Day"] + [C[0] for C in columns]
+
+        for time_of_day in times:
+            for W, S in starting.pop(time_of_day, ()):
+                active.append((span_of(S)[1], column_of[(S.day_in_cycle, S.ID)], W))
+            active = [A for A in active if A[0] > time_of_day]
+
+            row = [None] * len(columns)
+            for end, column, W in active:
+                row[column] = str(W)
+
+            # Times of day come from assignments, so each row holds a cell
+            assert(any(cell is not None for cell in row))
+            # Add Time of Day Column to Left Side of table
+            yield [time_of_day] + row
 
-        return schedule
+        assert(not starting)
 
 
     def decide_weights(self, undecided, policy_flags):
@@ -239,29 +304,37 @@ class ScheduleInterpreter():
 
 
     def extract_and_expand_time_ranges(self, avail):
+        times_by_day = {}
+
+        for day_in_cycle, minute_ranges in self.extract_time_ranges(avail).items():
+            times_by_day[day_in_cycle] = list(chain.from_iterable(
+                range(start, end, self.SHIFT_LENGTH) for start, end in minute_ranges))
+
+        return times_by_day
+
+
+    def extract_time_ranges(self, avail):
+        """ Like extract_and_expand_time_ranges, but keep each range as (start, end) minutes """
         assert(len(avail.keys()) > 0)
 
-        def expand(timeranges_in_day):
-            times_of_day = list()
+        def split(timeranges_in_day):
+            minute_ranges = list()
             # Format looks like "10am-11:30am, 1:00pm-5:00pm"
             for timerange in timeranges_in_day.split(', '):
-                assert("-" in timerange)
-
-                start, end = timerange.split("-")
-                military_time_on = False
+                start, end = self.parse_time_range(timerange)
 
-                times_of_day += \
-                    self.create_TOD_slot_range(start, end, military_time_on)
+                if start < end:
+                    minute_ranges.append((start, end))
 
-            return times_of_day
+            return minute_ranges
 
-        times_by_day = {}
+        ranges_by_day = {}
 
         for day_in_cycle in avail.keys():
             try:
-                times_of_day = expand(avail[day_in_cycle])
-                assert(len(times_of_day) > 0)
-                times_by_day[day_in_cycle] = times_of_day
+                minute_ranges = split(avail[day_in_cycle])
+                assert(len(minute_ranges) > 0)
+                ranges_by_day[day_in_cycle] = minute_ranges
 
             except (AssertionError, AttributeError) as e:
                 # Eat Error because some items in avail are irrelevant
@@ -269,23 +342,31 @@ class ScheduleInterpreter():
                 continue
 
 
-        return times_by_day
+        return ranges_by_day
 
 
     def make_table(self, cells):
+        return list(self.iter_table(cells))
+
+
+    def iter_table(self, cells):
+        """ Only rows holding a cell are built, so no empty rows to prune later """
+        if len(cells) < 1:
+            return
+
         width = max([C.col for C in cells])
-        height = max([C.row for C in cells])
-        table = [[None for col in range(width+1)]
-                    for row in range(height+1)]
+        cells_by_row = dict()
 
         for C in cells:
-            row = table[C.row]
-            row[C.col] = str(C.value)
+            cells_by_row.setdefault(C.row, []).append(C)
 
-        self.prune_empty_lists_from(table)
+        for row_index in sorted(cells_by_row.keys()):
+            row = [None] * (width+1)
 
-        return table
+            for C in cells_by_row[row_index]:
+                row[C.col] = str(C.value)
 
+            yield row
 
 
     # Make slots from provided availability schedules
@@ -306,6 +387,104 @@ class ScheduleInterpreter():
         return shifts
 
 
+    # Same as make_slots, but slots are rows of one columnar SlotTable
+    # Every range in the roster is parsed first, then all are expanded at once
+    def make_slot_table(self, type_id, *schedules):
+        table = SlotTable()
+        days, owners = array('h'), array('l')
+        starts, ends = array('l'), array('l')
+        id_2_schedule = self.assign_id(list(schedules))
+
+        for key in id_2_schedule.keys():
+            availability = id_2_schedule[key]
+            availability["id"] = key
+            availability["type"] = type_id
+
+            self.sanitize_availability(availability)
+            table.add_owner(key, availability.get("name", None), self.desired_hours(availability))
+            ranges_by_day = self.extract_time_ranges(availability)
+
+            for day in ranges_by_day.keys():
+                try: # filter by integer keys
+                    day_in_cycle = int(day)
+                except ValueError as e:
+                    log_debug("Key in ranges_by_day is not integer: %s", day)
+                    continue
+
+                for start, end in ranges_by_day[day]:
+                    days.append(day_in_cycle)
+                    owners.append(key)
+                    starts.append(start)
+                    ends.append(end)
+
+        table.add_runs(days, owners, starts, ends, type_id, self.SHIFT_LENGTH)
+
+        return table
+
+
+    # Yield (day_in_cycle, time_of_day) of every slot in one sanitized availability
+    # Lets a caller key and join slots without materializing them
+    def iter_slot_times(self, avail):
+        ranges_by_day = self.extract_time_ranges(avail)
+
+        for day in ranges_by_day.keys():
+            try: # filter by integer keys
+                day_in_cycle = int(day)
+            except ValueError as e:
+                log_debug("Key in ranges_by_day is not integer: %s", day)
+                continue
+
+            for start, end in ranges_by_day[day]:
+                yield from zip(repeat(day_in_cycle), range(start, end, self.SHIFT_LENGTH))
+
+
+    # Make intervals, i.e. runs of contiguous slots, from provided schedules
+    def make_intervals(self, type_id, *schedules):
+        intervals = []
+        id_2_schedule = self.assign_id(list(schedules))
+
+        for key in id_2_schedule.keys():
+            availability = id_2_schedule[key]
+            availability["id"] = key
+            availability["type"] = type_id
+
+            intervals += self.convert_availability_to_intervals(availability)
+
+        return intervals
+
+
+    def convert_availability_to_intervals(self, avail):
+        self.sanitize_availability(avail)
+
+        ranges_by_day = self.extract_time_ranges(avail)
+        name = avail.get("name", None) # If not provided, not needed
+        ID = avail["id"]
+        slot_type = avail["type"]
+        weight = int()
+        intervals = list()
+
+        for key in ranges_by_day.keys():
+            try: # filter by integer keys
+                day_in_cycle = int(key)
+            except ValueError as e:
+                log_debug("Key in ranges_by_day is not integer: %s", key)
+                continue
+
+            # Touching or overlapping ranges are one run, e.g. 10-13 and 13-17
+            merged = list()
+            for start, end in sorted(ranges_by_day[key]):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+
+            for start, end in merged:
+                I = Interval(day_in_cycle, ID, name, start, end, slot_type, weight)
+                intervals.append(I)
+
+        return intervals
+
+
     @staticmethod
     def index_elements(args):
         keys = range(len(args))
@@ -327,14 +506,9 @@ class ScheduleInterpreter():
         Note, this will work with either ROW/COL-MAJOR tables
             but is originally intended for row-removal """
         empty = [None for x in range(len(table[0]))]
-        z = 0
 
-        while z < len(table):
-            if table[z] == empty:
-                table.pop(z)
-
-            else:
-                z += 1
+        # One compaction pass, in-place for callers holding the same list
+        table[:] = [row for row in table if row != empty]
 
         return None
 
@@ -343,15 +517,19 @@ class ScheduleInterpreter():
         return ((num // interval) * interval)
 
 
-    # Given std format of "hh:mm" return the int mmmm
+    # Given any format timecheck accepts, return the int mmmm
+    # Rosters repeat the same few strings, so results are memoized
     @staticmethod
+    @lru_cache(maxsize=TIME_CACHE_SIZE)
     def text_to_minutes(time):
-        t = ScheduleInterpreter.timecheck(time)
-        hr = int(t.split(':')[0])
-        m = int(t.split(':')[1])
-        return (60 * hr + m)
+        hr, m, suffix = ScheduleInterpreter.tokenize_time(time)
+        hr = int(hr)
+
+        if suffix == 'pm':
+            hr = hr % 12 + 12
+
+        return (60 * hr + int(m))
 
-    # TODO: Completely rework this timecheck(time) method from scratch
     # Expecting any of the following formats:
     #   hh
     #   hh pm/am
@@ -363,35 +541,25 @@ class ScheduleInterpreter():
     # Returning hh:mm
     @staticmethod
     def timecheck(time):
-        tmp = None
-        is_past_noon = False
-        # Do not change order of operations carelessly
-        # 1
-        if ' ' in time: # Remove spaces to simplify cases
-            time = ''.join(time.split(' '))
-
-        # 2
-        if 'pm' in time:
-            tmp = time[:time.find('pm')] # Remove suffix
-            is_past_noon = True
-        elif 'am' in time:
-            tmp = time[:time.find('am')]
-        else:
-            tmp = time
-
-        # 3
-        if ':' in tmp:
-            result = tmp
-        else:
-            result = tmp + ':00'
-
-        # 4
-        if is_past_noon:
-            hr, m = result.split(':')
-            hr_proper = int(hr) % 12 + 12
-            result = "%s:%s" % (hr_proper, m)
-
-        return result
+        hr, m, suffix = ScheduleInterpreter.tokenize_time(time)
+
+        if suffix == 'pm':
+            hr = int(hr) % 12 + 12
+
+        return "%s:%s" % (hr, m)
+
+    # One regex pass over the text instead of repeated splits and joins
+    # RETURN 3-tuple of hour text, minute text and 'am', 'pm' or None
+    @staticmethod
+    def tokenize_time(time):
+        tokens = TIME_FORMAT.fullmatch(time)
+
+        if tokens is None:
+            raise ValueError(f"Unrecognized time of day: {time!r}")
+
+        hr, m, suffix = tokens.groups()
+
+        return (hr, m or '00', suffix and suffix.lower())
 
 class Cell():
     """ Purely a data object """
@@ -400,10 +568,52 @@ class Cell():
         self.col = col
         self.value = value
 
+class Interval():
+    """
+    A run of contiguous slots for one owner on one day, kept as [start, end)
+    Matching on intervals keeps the graph small, see matcher.assign_intervals """
+
+    def __init__(
+            self,
+            day_in_cycle=-1,
+            identifier=-1,
+            nice_name="No Name",
+            start=-1,
+            end=-1,
+            timeslot_class=-1,
+            weight=-1
+        ):
+
+        self.day_in_cycle = day_in_cycle
+        self.ID = identifier
+        self.name = nice_name
+        self.start = start
+        self.end = end
+        self.type = timeslot_class
+        self.weight = weight
+
+    def __repr__(self):
+        raw_repr = [self.name, self.weight, self.type, self.ID,
+                    self.day_in_cycle, self.start, self.end]
+
+        return(f"{'.'.join(map(str, raw_repr))}")
+
+    def __str__(self):
+        return(str(self.name))
+
+    def clip(self, start, end):
+        return Interval(self.day_in_cycle, self.ID, self.name,
+                        start, end, self.type, self.weight)
+
 class Slot():
     """
     The UID used in previous versions of the project
     redesigned in OOP fashion for cleaner function and referencing """
+    MINUTES_PER_DAY = 24 * 60
+
+    # No per-instance __dict__, rosters make a great many of these
+    __slots__ = ('day_in_cycle', 'ID', 'match_ID', 'name',
+                 'time_of_day', 'type', 'weight', 'key')
 
     def __init__(
             self,
@@ -426,7 +636,17 @@ class Slot():
         self.type = timeslot_class
         self.weight = weight
 
-        self.ordered_repr = [
+        # Packed once, since sorting and joining compare slots constantly
+        # Collision-free as long as 0 <= time_of_day < MINUTES_PER_DAY
+        self.key = day_in_cycle * self.MINUTES_PER_DAY + time_of_day
+
+        if validation_on:
+            assert(self.validation_check_passes())
+
+
+    @property
+    def ordered_repr(self):
+        return [
             self.name,
             self.weight,
             self.type,
@@ -435,10 +655,6 @@ class Slot():
             self.time_of_day
         ]
 
-        if validation_on:
-            assert(self.validation_check_passes())
-
-
     def __repr__(self):
         raw_repr = self.ordered_repr
         clear_repr = map(str, raw_repr)
@@ -450,23 +666,20 @@ class Slot():
         return(str(self.name))
 
     def __int__(self):
-        repr_for_comparisons = f"{self.day_in_cycle}{self.time_of_day}"
-        just_time_and_day = int(repr_for_comparisons)
-
-        return just_time_and_day
+        return self.key
 
     def __eq__(self, other):
-        return(int(self) == int(other))
+        return(self.key == int(other))
 
 
     def __ne__(self, other):
-        return(int(self) != int(other))
+        return(self.key != int(other))
 
     def __gt__(self, other):
-        return(int(self) > int(other))
+        return(self.key > int(other))
 
     def __lt__(self, other):
-        return(int(self) < int(other))
+        return(self.key < int(other))
 
     def __hash__(self):
         return(id(self))
@@ -485,15 +698,63 @@ class Slot():
         return [Slot(*args) for args in tuples_of_init_args]
 
 
-
-
-
-
-
-
-
-
-
-
-
-
+class SlotTable():
+    """
+    Columnar store for many slots of one kind, one row per slot
+    Each column is a typed array, so a row costs a few dozen bytes
+    instead of a full Slot object. Names are kept once per owner """
+
+    def __init__(self):
+        self.day_in_cycle = array('h')
+        self.time_of_day = array('h')
+        self.owner = array('l')
+        self.type = array('b')
+        self.weight = array('l')
+        self.key = array('l')
+        self.names = dict() # owner ID -> name
+        self.hours = dict() # owner ID -> desired hours per cycle, if given
+
+    def __len__(self):
+        return len(self.key)
+
+    def __getitem__(self, row):
+        """ Materialize one row as a Slot, e.g. for make_schedule """
+        ID = self.owner[row]
+
+        return Slot(self.day_in_cycle[row], ID, self.names.get(ID),
+                    self.time_of_day[row], self.type[row], self.weight[row])
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def add_owner(self, ID, name, hours=None):
+        self.names[ID] = name
+
+        if hours is not None:
+            self.hours[ID] = hours
+
+    def add_slot(self, day_in_cycle, ID, time_of_day, timeslot_class, weight=0):
+        self.day_in_cycle.append(day_in_cycle)
+        self.time_of_day.append(time_of_day)
+        self.owner.append(ID)
+        self.type.append(timeslot_class)
+        self.weight.append(weight)
+        self.key.append(day_in_cycle * Slot.MINUTES_PER_DAY + time_of_day)
+
+    def add_runs(self, days, owners, starts, ends, timeslot_class, interval, weight=0):
+        """
+        Expand runs [start, end) into one row per interval, all runs in one batch
+        Columns are filled with repeat/range iterators consumed by array.extend,
+        the arange/repeat idiom without a per-slot Python loop """
+        lengths = list(map(len, map(range, starts, ends, repeat(interval))))
+        total = sum(lengths)
+        offsets = [day * Slot.MINUTES_PER_DAY for day in days]
+
+        self.day_in_cycle.extend(chain.from_iterable(map(repeat, days, lengths)))
+        self.time_of_day.extend(chain.from_iterable(
+            map(range, starts, ends, repeat(interval))))
+        self.owner.extend(chain.from_iterable(map(repeat, owners, lengths)))
+        self.type.extend(repeat(timeslot_class, total))
+        self.weight.extend(repeat(weight, total))
+        self.key.extend(chain.from_iterable(map(range,
+            map(add, offsets, starts), map(add, offsets, ends), repeat(interval))))
@@ -0,0 +1,410 @@
+# SERVICE.PY
+#
+# Long-lived local HTTP service around the interpreter and the matcher
+# Startup, imports, parsed time ranges and shift templates are paid once,
+# so a typical request only pays for its own slots and solve
+#
+# Solves run on a thread pool so the event loop never blocks; threads share
+# the process-wide time parsing caches and the warm shift tables. At most
+# max_concurrent solves are admitted at once, the rest wait their turn, and
+# a request past its timeout answers 504. A request that is cancelled or
+# times out while waiting is never started, one already on a worker runs
+# to completion and its result is dropped. Until then it keeps its admission
+# and, for a session edit, the session, so nothing runs beside it. Solves
+# with a time_limit use the anytime backend, which also stops at its next
+# step once the request is gone
+#
+# Every schedule comes with its analytics: uncovered runs per position, and
+# assigned against requested hours per employee, see ANALYTICS.PY
+#
+# Usage: python3 service.py [--port 8080] [--workers N] [--max-concurrent N]
+#
+#   POST   /schedule                         {"availability": [...], "shifts": [...],
+#                                             "honor_hours": false, "by_interval": false,
+#                                             "backend": "python", "time_limit": 0.05}
+#   POST   /sessions                         {"shifts": [...]}, answers {"session": id}
+#   PUT    /sessions/<id>/employees/<name>   availability of one employee
+#   DELETE /sessions/<id>/employees/<name>
+#   GET    /sessions/<id>/schedule
+#   DELETE /sessions/<id>
+#   GET    /health
+# "shifts" is optional everywhere and defaults to DEFAULT_SHIFT_TEMPLATES
+from scheduler import ScheduleInterpreter
+from matcher import (DEFAULT_SHIFT_TEMPLATES, assign_by_hours, assign_intervals,
+                     assign_shifts, check_matching_options)
+from session import SchedulingSession
+from solvers import get_backend, limit_backend
+from metrics import RunReport
+from analytics import ScheduleAnalytics
+from cache import ScheduleCache
+from logger import *
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http import HTTPStatus
+from urllib.parse import unquote
+
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+
+# Warm state kept per service, least recently used dropped first
+TEMPLATE_LIMIT = 32
+SESSION_LIMIT = 256
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Availability or templates the scheduler can not read are the client's mistake
+@contextmanager
+def client_input(what):
+    try:
+        yield
+    except ValueError as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"unreadable {what}: {e}")
+
+
+class ScheduleService():
+    """ State shared by every connection: warm tables, sessions and the worker pool """
+
+    def __init__(self, workers=None, max_concurrent=8, timeout=10.0, executor=None):
+        self.scheduler = ScheduleInterpreter()
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers)
+        self.admission = asyncio.Semaphore(max_concurrent)
+        self.timeout = timeout
+        self.shift_tables = OrderedDict() # template key -> SlotTable
+        self.tables_lock = threading.Lock()
+        self.sessions = OrderedDict()     # session id -> (SchedulingSession, asyncio.Lock)
+        self.session_ids = itertools.count(1)
+        self.served = 0
+
+
+    # Run a blocking call on the pool within the admission limit and timeout
+    # The admission slot, and lock if given, are held until the worker returns,
+    # even when the request stopped waiting for it. Only the wait times out
+    # A cancel event is set when the request times out or is cancelled,
+    # so cooperative work on the worker can stop early
+    async def offload(self, procedure, *args, cancel=None, lock=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        guards = [self.admission] if lock is None else [lock, self.admission]
+
+        async def start():
+            taken = list()
+
+            try:
+                for guard in guards:
+                    await guard.acquire()
+                    taken.append(guard)
+                future = loop.run_in_executor(self.executor, procedure, *args)
+            except BaseException:
+                for guard in reversed(taken):
+                    guard.release()
+                raise
+
+            def finished(future):
+                if not future.cancelled():
+                    future.exception() # Retrieved, the request may be gone
+                for guard in reversed(taken):
+                    guard.release()
+
+            future.add_done_callback(finished)
+            return future
+
+        try:
+            future = await asyncio.wait_for(start(), self.timeout)
+            return await asyncio.wait_for(asyncio.shield(future), deadline - loop.time())
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.GATEWAY_TIMEOUT, "solve timed out")
+        finally:
+            if cancel is not None:
+                cancel.set()
+
+
+    # Shift templates rarely change between requests, so their slots are kept
+    # Tables are only ever read by the matcher, threads may share them
+    def shift_table(self, templates):
+        key = ScheduleCache.key_for(templates)
+
+        with self.tables_lock:
+            table = self.shift_tables.get(key)
+            if table is not None:
+                self.shift_tables.move_to_end(key)
+                return table
+
+        table = self.scheduler.make_slot_table(ScheduleInterpreter.TYPE_SHIFT,
+                                               *[dict(T) for T in templates])
+
+        with self.tables_lock:
+            self.shift_tables[key] = table
+            while len(self.shift_tables) > TEMPLATE_LIMIT:
+                self.shift_tables.popitem(last=False)
+
+        return table
+
+
+    # Answers 400 for anything solve would only trip over on a worker
+    def check_schedule_request(self, request):
+        for field in ('availability', 'shifts'):
+            entries = request.get(field) or []
+            if not isinstance(entries, list) or not all(isinstance(A, dict) and A for A in entries):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"{field} must be a list of JSON objects")
+
+        try:
+            if request.get('backend') is not None:
+                get_backend(request['backend'])
+            if request.get('time_limit') is not None:
+                limit_backend(request.get('backend'), float(request['time_limit']))
+            timed = request.get('time_limit') is not None # A backend even if none is named
+            check_matching_options(by_interval=request.get('by_interval'),
+                                   honor_hours=request.get('honor_hours'),
+                                   backend=request.get('backend') or ('anytime' if timed else None))
+        except (TypeError, ValueError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+
+
+    # Runs on a worker, same choices as matcher.make_matching without the files
+    # A time_limit in seconds answers with the best schedule found by then,
+    # on the requested backend if it takes one, otherwise on the anytime backend
+    def solve(self, request, cancel=None):
+        availability = [dict(A) for A in request.get('availability', [])]
+        templates = request.get('shifts') or DEFAULT_SHIFT_TEMPLATES
+        backend = request.get('backend') # By name, see solvers.BACKENDS
+
+        if request.get('time_limit') is not None:
+            backend = limit_backend(backend, float(request['time_limit']), cancel)
+        workers = ScheduleInterpreter.TYPE_WORKER
+        scheduler = self.scheduler
+        report = RunReport()
+
+        if request.get('by_interval'):
+            with report.stage('make_slots'), client_input("availability or shifts"):
+                w_intervals = scheduler.make_intervals(workers, *availability)
+                s_intervals = scheduler.make_intervals(ScheduleInterpreter.TYPE_SHIFT,
+                                                       *[dict(T) for T in templates])
+            assignments = assign_intervals(w_intervals, s_intervals, report, backend)
+            shifts = s_intervals
+            requested = {A["id"]: scheduler.desired_hours(A) for A in availability}
+            names = {A["id"]: A.get("name") for A in availability}
+
+        else:
+            with report.stage('make_slots'), client_input("availability or shifts"):
+                w_table = scheduler.make_slot_table(workers, *availability)
+                s_table = self.shift_table(templates)
+
+            if request.get('honor_hours'):
+                assignments = assign_by_hours(w_table, s_table, scheduler.SHIFT_LENGTH, report)
+            else:
+                assignments = assign_shifts(w_table, s_table, report, backend)
+            shifts = s_table
+            requested = {ID: w_table.hours.get(ID) for ID in w_table.names}
+            names = w_table.names
+
+        with report.stage('make_schedule'):
+            table = scheduler.make_schedule(assignments)
+
+        with report.stage('analytics'):
+            analytics = ScheduleAnalytics(scheduler.SHIFT_LENGTH).add(
+                assignments, shifts, requested, names)
+
+        return {'table': table, 'analytics': analytics.as_dict(), 'report': report.as_dict()}
+
+
+    def session(self, session_id):
+        entry = self.sessions.get(session_id)
+
+        if entry is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"no session {session_id}")
+
+        self.sessions.move_to_end(session_id)
+        return entry
+
+
+    async def open_session(self, request):
+        self.check_schedule_request({'shifts': request.get('shifts')})
+        templates = request.get('shifts') or DEFAULT_SHIFT_TEMPLATES
+
+        with client_input("shifts"):
+            session = await self.offload(SchedulingSession, templates, self.scheduler)
+        session_id = str(next(self.session_ids))
+
+        self.sessions[session_id] = (session, asyncio.Lock())
+        while len(self.sessions) > SESSION_LIMIT:
+            self.sessions.popitem(last=False)
+
+        return {'session': session_id}
+
+
+    # Edits of one session are serialized, different sessions run side by side
+    async def edit_session(self, session_id, procedure, *args):
+        session, lock = self.session(session_id)
+
+        return await self.offload(procedure, session, *args, lock=lock)
+
+
+    async def route(self, method, path, request):
+        parts = [unquote(P) for P in path.split('?')[0].strip('/').split('/')]
+
+        if method == 'GET' and parts == ['health']:
+            return {'status': 'ok', 'served': self.served, 'sessions': len(self.sessions),
+                    'shift_tables': len(self.shift_tables)}
+
+        if method == 'POST' and parts == ['schedule']:
+            self.check_schedule_request(request)
+            cancel = threading.Event()
+            return await self.offload(self.solve, request, cancel, cancel=cancel)
+
+        if parts[0] == 'sessions':
+            if method == 'POST' and len(parts) == 1:
+                return await self.open_session(request)
+
+            if method == 'DELETE' and len(parts) == 2:
+                self.session(parts[1])
+                del self.sessions[parts[1]]
+                return {'closed': parts[1]}
+
+            if method == 'GET' and parts[2:] == ['schedule']:
+                table = await self.edit_session(parts[1], SchedulingSession.make_schedule)
+                return {'table': table}
+
+            if len(parts) == 4 and parts[2] == 'employees':
+                if method == 'PUT':
+                    if not request:
+                        raise HTTPError(HTTPStatus.BAD_REQUEST, "availability is empty")
+                    with client_input("availability"):
+                        moved = await self.edit_session(parts[1],
+                                                        SchedulingSession.update_availability,
+                                                        parts[3], request)
+                    return {'moved': moved}
+
+                if method == 'DELETE':
+                    moved = await self.edit_session(parts[1], SchedulingSession.remove_availability,
+                                                    parts[3])
+                    return {'moved': moved}
+
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"no route for {method} {path}")
+
+
+    # One connection, any number of keep-alive requests
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+
+                request_parts = request_line.decode('latin-1').split()
+                if len(request_parts) != 3:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST,
+                                       {'error': "malformed request line"}, closing=True)
+                    break
+
+                method, path, version = request_parts
+                headers = dict()
+
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, value = line.decode('latin-1').split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if 0 < length <= MAX_BODY_BYTES else b''
+                status, answer = await self.answer(method, path, body, length)
+
+                closing = (headers.get('connection', '').lower() == 'close'
+                           or version == 'HTTP/1.0' or length > MAX_BODY_BYTES) # Body left unread
+                await self.respond(writer, status, answer, closing)
+
+                if closing:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass # Client went away or spoke something other than HTTP
+        except asyncio.CancelledError:
+            pass # Server shutting down, nothing above this task to tell
+        finally:
+            writer.close()
+
+
+    async def respond(self, writer, status, answer, closing):
+        payload = json.dumps(answer).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'close' if closing else 'keep-alive'}\r\n\r\n".encode('latin-1')
+            + payload)
+        await writer.drain()
+
+
+    # RETURN 2-tuple of HTTPStatus and a JSON-serializable answer
+    async def answer(self, method, path, body, length):
+        try:
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+
+            try:
+                request = json.loads(body) if body else {}
+            except ValueError as e:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid JSON: {e}")
+
+            if not isinstance(request, dict):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "request body must be a JSON object")
+
+            answer = await self.route(method, path, request)
+            self.served += 1
+            return HTTPStatus.OK, answer
+
+        except HTTPError as e:
+            return e.status, {'error': str(e)}
+
+        except Exception as e:
+            log(f"{method} {path} failed: {type(e).__name__}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(e).__name__}: {e}"}
+
+
+    # RETURN the asyncio server, already listening
+    async def start(self, host='127.0.0.1', port=8080):
+        return await asyncio.start_server(self.handle, host, port)
+
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(host, port, **options):
+    service = ScheduleService(**options)
+    server = await service.start(host, port)
+    log(f"Serving schedules on http://{host}:{server.sockets[0].getsockname()[1]}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve schedules over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-concurrent', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    options = parser.parse_args()
+
+    try:
+        asyncio.run(serve(options.host, options.port, workers=options.workers,
+                          max_concurrent=options.max_concurrent, timeout=options.timeout))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,129 @@
+# SESSION.PY
+#
+# A long-lived scheduling session for frequent small availability edits
+# Slots, the edge index and the current matching stay in memory, so
+# adding, removing or updating one employee repairs the matching with
+# local augmenting paths instead of re-solving the whole roster
+#
+# The edge index is implicit: a worker slot and a shift slot are joined
+# when they share a packed key, see select_matching_pairs in MATCHER.PY
+from scheduler import ScheduleInterpreter
+from collections import deque
+
+
+class SchedulingSession():
+    """
+    Keeps shift slots, worker slots by employee and a matching between them
+    Employees are named by any hashable id chosen by the caller """
+
+    def __init__(self, shift_templates, scheduler=None):
+        self.scheduler = scheduler or ScheduleInterpreter()
+        self.slots_of = dict()  # employee id -> worker slots
+        self.workers_at = dict() # key -> worker slots, dict as an ordered set
+        self.shifts_at = dict() # key -> shift slots
+        self.mate = dict()      # slot -> matched slot, both directions
+
+        shift_templates = [dict(T) for T in shift_templates]
+        shifts = self.scheduler.make_slots(ScheduleInterpreter.TYPE_SHIFT, *shift_templates)
+
+        for S in shifts:
+            self.shifts_at.setdefault(S.key, []).append(S)
+
+
+    def add_availability(self, employee_id, availability):
+        """ Add one employee, or replace their availability if already known """
+        availability = dict(availability)
+        availability["id"] = employee_id
+        availability["type"] = ScheduleInterpreter.TYPE_WORKER
+        slots = self.scheduler.convert_availability_to_slots(availability) # Parsed before any change
+
+        if employee_id in self.slots_of:
+            self.remove_availability(employee_id)
+        self.slots_of[employee_id] = slots
+
+        for W in slots:
+            self.workers_at.setdefault(W.key, dict())[W] = None
+
+        # Each new slot can only gain coverage, never take it from others
+        moved = 0
+        for W in slots:
+            moved += self.augment_from(W)
+
+        return moved
+
+
+    def remove_availability(self, employee_id):
+        """ Drop one employee, then refill the shifts they were covering """
+        freed = list()
+
+        for W in self.slots_of.pop(employee_id, []):
+            del self.workers_at[W.key][W]
+            partner = self.mate.pop(W, None)
+
+            if partner is not None:
+                del self.mate[partner]
+                freed.append(partner)
+
+        moved = 0
+        for S in freed:
+            moved += self.augment_from(S)
+
+        return moved
+
+
+    def update_availability(self, employee_id, availability):
+        return self.add_availability(employee_id, availability)
+
+
+    def neighbors(self, slot):
+        if slot.type == ScheduleInterpreter.TYPE_SHIFT:
+            return self.workers_at.get(slot.key, ())
+
+        return self.shifts_at.get(slot.key, ())
+
+
+    # Breadth-first search for a shortest augmenting path from a free slot,
+    # so a repair moves as few existing assignments as possible
+    # RETURN number of assignments made or changed, 0 if no path exists
+    def augment_from(self, start):
+        if start in self.mate:
+            return 0
+
+        previous = {start: None}
+        queue = deque([start])
+
+        while queue:
+            x = queue.popleft()
+
+            for y in self.neighbors(x):
+                if y is self.mate.get(x):
+                    continue
+
+                partner = self.mate.get(y)
+
+                if partner is None:
+                    # Flip the path: every x takes the y after it
+                    moved = 0
+                    while x is not None:
+                        self.mate[x] = y
+                        self.mate[y] = x
+                        moved += 1
+                        x, y = previous[x] or (None, None)
+
+                    return moved
+
+                if partner not in previous:
+                    previous[partner] = (x, y)
+                    queue.append(partner)
+
+        return 0
+
+
+    def assignments(self):
+        """ Same shape as matcher.assign_shifts, (worker slot, shift slot) pairs """
+        return [(W, S) for W, S in self.mate.items()
+                    if W.type == ScheduleInterpreter.TYPE_WORKER]
+
+
+    def make_schedule(self):
+        return self.scheduler.make_schedule(self.assignments())
@@ -0,0 +1,265 @@
+# SOLVERS.PY
+#
+# Registry of backends that solve the Job Matching problem for the matcher
+# Every backend takes (u, v, weight) edges and returns matched (u, v) pairs,
+# and declares what it can do, so callers can pick one by name or by need:
+#   weighted     maximum weight among maximum matchings, not just cardinality
+#   capacities   vertices may take more than one partner
+#   time_limit   gives up after a given number of seconds
+#
+# Built-in backends:
+#   python   in this process, see BIPARTITE.PY
+#   greedy   approximate and fast, reports how far from maximum it may be
+#   anytime  best matching found within its time limit, exact given enough
+#   pipe     a separate process fed a graph stream on stdin that answers
+#            with a matching stream on stdout, see GRAPHFILE.PY. Running
+#            this module as a script is such a solver
+#
+# Usage as a solver: python3 solvers.py < graph.stream > matching.stream
+from bipartite import anytime_matching, approximate_matching, match_by_components
+from graphfile import read_stream, write_stream
+
+from time import perf_counter
+
+import os
+import subprocess
+import sys
+import threading
+
+
+class SolverError(Exception):
+    pass
+
+
+class SolverBackend():
+    """ What every backend declares, subclasses provide solve """
+    name = None
+    weighted = False
+    capacities = False
+    time_limit = False
+
+    def supports(self, weighted=False, capacities=False, time_limit=False):
+        return ((self.weighted or not weighted) and (self.capacities or not capacities)
+                and (self.time_limit or not time_limit))
+
+    # A list passed as report collects ComponentReports where the backend has them
+    # RETURN list of (u, v) matched pairs
+    def solve(self, edges, report=None, time_limit=None):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class InProcessBackend(SolverBackend):
+    name = 'python'
+    weighted = True
+
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def solve(self, edges, report=None, time_limit=None):
+        return match_by_components(edges, maximize_weight=True, workers=self.workers,
+                                   report=report)
+
+
+class ApproximateBackend(SolverBackend):
+    """
+    Greedy by weight plus a few phases of short augmenting paths, see
+    bipartite.approximate_matching. More phases, closer to maximum coverage.
+    Weights only order the greedy pass, so it does not count as weighted """
+    name = 'greedy'
+
+    def __init__(self, phases=2, name=None):
+        self.phases = phases
+        self.name = name or self.name
+
+    def solve(self, edges, report=None, time_limit=None):
+        return approximate_matching(edges, self.phases, report)
+
+
+class AnytimeBackend(SolverBackend):
+    """
+    Returns the best matching found when time runs out, see
+    bipartite.anytime_matching. A time_limit given to solve wins over the
+    backend's own. progress and cancel are passed on as they are """
+    name = 'anytime'
+    weighted = True
+    time_limit = True
+
+    def __init__(self, time_limit=None, progress=None, cancel=None, name=None):
+        self.limit = time_limit
+        self.progress = progress
+        self.cancel = cancel
+        self.name = name or self.name
+
+    def solve(self, edges, report=None, time_limit=None):
+        time_limit = self.limit if time_limit is None else time_limit
+        deadline = None if time_limit is None else perf_counter() + time_limit
+
+        return anytime_matching(edges, deadline, self.progress, self.cancel, report=report)
+
+
+class PipeBackend(SolverBackend):
+    """
+    Any executable speaking the graph stream format over its standard streams
+    Nothing touches the disk, edges go to the pipe a chunk at a time while
+    they are generated, and the matching is read back as it arrives """
+    name = 'pipe'
+    time_limit = True
+
+    def __init__(self, command=None, name=None, weighted=True):
+        self.command = command or [sys.executable, os.path.abspath(__file__)]
+        self.name = name or self.name
+        self.weighted = weighted
+
+    def solve(self, edges, report=None, time_limit=None):
+        process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        failures, errors, expired = list(), list(), threading.Event()
+
+        def expire():
+            expired.set()
+            process.kill()
+
+        # Stdin is fed and stderr drained on their own threads, so neither
+        # a big graph nor a chatty solver can block reading the answer
+        threads = [threading.Thread(target=feed_edges, args=(process.stdin, edges, failures)),
+                   threading.Thread(target=lambda: errors.append(process.stderr.read()))]
+        timer = threading.Timer(time_limit, expire) if time_limit is not None else None
+
+        for thread in threads:
+            thread.start()
+        if timer is not None:
+            timer.start()
+
+        try:
+            matching = list(read_stream(process.stdout))
+        except ValueError as e:
+            matching = e
+        finally:
+            for thread in threads:
+                thread.join()
+            process.wait()
+            if timer is not None:
+                timer.cancel()
+            process.stdout.close()
+            process.stderr.close()
+
+        if failures:
+            raise failures[0]
+
+        if expired.is_set() and process.returncode != 0:
+            raise TimeoutError(f"{self.name} solver took over {time_limit}s")
+
+        if process.returncode != 0:
+            raise SolverError(f"{self.name} solver exited with {process.returncode}: "
+                              f"{errors[0].decode(errors='replace').strip()}")
+
+        if isinstance(matching, ValueError):
+            raise SolverError(f"{self.name} solver answered with no matching: {matching}")
+
+        return matching
+
+
+class CallableBackend(SolverBackend):
+    """ Any function from an iterable of (u, v, weight) to (u, v) pairs """
+
+    def __init__(self, function, name, weighted=True, capacities=False, time_limit=False):
+        self.function = function
+        self.name = name
+        self.weighted = weighted
+        self.capacities = capacities
+        self.time_limit = time_limit
+
+    def solve(self, edges, report=None, time_limit=None):
+        if self.time_limit:
+            return list(self.function(edges, time_limit=time_limit))
+
+        return list(self.function(edges))
+
+
+# Backends by name, in the order they were registered
+BACKENDS = dict()
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+    return backend
+
+register_backend(InProcessBackend())
+register_backend(ApproximateBackend())
+register_backend(AnytimeBackend())
+register_backend(PipeBackend())
+
+
+# Backends may be given as objects or by their registered name
+def get_backend(backend):
+    if isinstance(backend, SolverBackend):
+        return backend
+
+    try:
+        return BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"no solver backend named {backend!r}, "
+                         f"registered are {', '.join(BACKENDS)}")
+
+
+# A backend bound to one time limit, for callers that can not pass it to solve
+# The anytime backend keeps its progress and takes cancel, see AnytimeBackend
+def limit_backend(backend, time_limit, cancel=None):
+    backend = get_backend(backend or 'anytime')
+
+    if not backend.supports(time_limit=True):
+        raise ValueError(f"{backend.name} solver backend takes no time limit")
+
+    if isinstance(backend, AnytimeBackend):
+        return AnytimeBackend(time_limit, backend.progress, cancel or backend.cancel, backend.name)
+
+    return CallableBackend(lambda edges: backend.solve(edges, time_limit=time_limit), backend.name,
+                           backend.weighted, backend.capacities)
+
+
+# RETURN the registered name a backend answers to, None for unregistered
+# objects and functions, whose results can not be told apart by name
+def registered_name(backend):
+    if isinstance(backend, SolverBackend):
+        return backend.name if BACKENDS.get(backend.name) is backend else None
+
+    return backend if backend in BACKENDS else None
+
+
+# RETURN the first registered backend that supports every need
+def select_backend(weighted=False, capacities=False, time_limit=False):
+    for backend in BACKENDS.values():
+        if backend.supports(weighted, capacities, time_limit):
+            return backend
+
+    raise ValueError("no solver backend supports that")
+
+
+# Write edges to a solver's stdin, then close it to mark their end
+# A solver that quit early shows in its exit status, other failures,
+# e.g. a malformed edge from the caller, are kept for the caller
+def feed_edges(stdin, edges, failures):
+    try:
+        write_stream(stdin, edges)
+    except OSError:
+        pass
+    except Exception as e:
+        failures.append(e)
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+
+# The pipe backend's default solver, in-process matching behind the graph stream format
+def solve_stream(source, sink):
+    edges = (edge if len(edge) == 3 else edge + (0,) for edge in read_stream(source))
+
+    write_stream(sink, match_by_components(edges), weighted=False)
+
+
+if __name__ == '__main__':
+    solve_stream(sys.stdin.buffer, sys.stdout.buffer)